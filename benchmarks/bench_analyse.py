@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Measure the throughput and the latency of Analyse.full_analysis against a
+local stand-in of the OSM API that replays recorded responses with an injected
+latency, so the results don't depend on the network or on the live API.
+
+The changeset metadata, the changeset content and the user details are served
+from the recordings folder, which has the same layout as tests/api:
+changeset/<id>.xml, changeset/<id>/download.xml and user/<id>.xml.
+
+Usage:
+  python benchmarks/bench_analyse.py [--latency 0.05] [--concurrency 1 8 32]
+  python benchmarks/bench_analyse.py --save benchmarks/baseline.json
+  python benchmarks/bench_analyse.py --compare benchmarks/baseline.json
+
+Each concurrency level runs --repeat times and the best value of each
+measure is kept, as the worse ones measure the noise of the machine. With --compare, the exit
+status is 1 if the throughput of any concurrency level is lower or its p99
+latency is higher than the baseline by more than the tolerance. The baselines
+are only comparable in the same machine, so save one before the changes.
+"""
+import argparse
+import json
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import cycle, islice
+from os import listdir
+from os.path import abspath, dirname, isfile, join
+from threading import Thread
+from time import perf_counter, sleep
+
+from osmcha import __version__
+from osmcha.cache import TTLCache
+from osmcha.changeset import Analyse
+from osmcha.client import OSMClient
+
+
+RECORDINGS = join(dirname(dirname(abspath(__file__))), 'tests', 'api')
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serve /api/0.6/<path> from <recordings>/<path>.xml after sleeping the
+    latency of the server.
+    """
+    protocol_version = 'HTTP/1.1'
+    # the headers and the body are written separately, which waits for the
+    # delayed ACK of the client on keep-alive connections without this
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        sleep(max(0, server.latency + random.uniform(-1, 1) * server.jitter))
+        path = self.path.split('?', 1)[0]
+        filename = join(server.recordings, path.replace('/api/0.6/', '', 1) + '.xml')
+        if path.startswith('/api/0.6/') and isfile(filename):
+            with open(filename, 'rb') as f:
+                status, content = 200, f.read()
+        else:
+            status, content = 404, b'Not found'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(recordings=RECORDINGS, latency=0.05, jitter=0):
+    """Start the stand-in server in a daemon thread and return it. The URL of
+    the API is in server.api_url.
+
+    Args:
+        recordings (str): the folder of the recorded responses.
+        latency (float): seconds waited before each response.
+        jitter (float): maximum number of seconds randomly added to or
+            subtracted from the latency.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 128
+    server.recordings = recordings
+    server.latency = latency
+    server.jitter = jitter
+    server.api_url = 'http://127.0.0.1:{}/api/0.6'.format(server.server_address[1])
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def recorded_changesets(recordings=RECORDINGS):
+    """Return the ids of the changesets with recorded metadata and content."""
+    folder = join(recordings, 'changeset')
+    return sorted(
+        int(name[:-4]) for name in listdir(folder)
+        if name.endswith('.xml') and isfile(join(folder, name[:-4], 'download.xml'))
+        )
+
+
+def percentile(values, fraction):
+    """Return the value below which the fraction of the sorted values is."""
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def run_level(api_url, changesets, concurrency, user_cache=False):
+    """Analyse the changesets with a pool of concurrency threads sharing an
+    OSMClient and return a dict with the throughput and the latencies.
+    """
+    client = OSMClient(
+        api_url=api_url, pool_size=concurrency,
+        # without the cache, the user of every changeset is requested
+        user_cache=None if user_cache else TTLCache(maxsize=0, name='users')
+        )
+
+    def analyse(changeset):
+        start = perf_counter()
+        ch = Analyse(changeset, client=client)
+        ch.full_analysis()
+        return perf_counter() - start
+
+    # the warm up analyses open the connections and load the word lists
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(analyse, changesets[:concurrency]))
+        start = perf_counter()
+        latencies = sorted(executor.map(analyse, changesets))
+        elapsed = perf_counter() - start
+    client.close()
+    return {
+        'concurrency': concurrency,
+        'changesets': len(changesets),
+        'seconds': round(elapsed, 4),
+        'changesets_per_second': round(len(changesets) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        }
+
+
+def compare(results, baseline, tolerance):
+    """Return the messages of the regressions of the results in relation to
+    the baseline. The levels that are not in the baseline are ignored.
+    """
+    previous = {level['concurrency']: level for level in baseline['levels']}
+    regressions = []
+    for level in results['levels']:
+        base = previous.get(level['concurrency'])
+        if base is None:
+            continue
+        if level['changesets_per_second'] < base['changesets_per_second'] * (1 - tolerance):
+            regressions.append('concurrency {}: {} changesets/s, baseline {}'.format(
+                level['concurrency'], level['changesets_per_second'],
+                base['changesets_per_second']
+                ))
+        if level['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append('concurrency {}: p99 {} ms, baseline {} ms'.format(
+                level['concurrency'], level['p99_ms'], base['p99_ms']
+                ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recordings', default=RECORDINGS,
+                        help='folder with the recorded API responses')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds waited by the server before each response')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='maximum random variation of the latency in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                        help='number of threads of each run')
+    parser.add_argument('--size', type=int, default=100,
+                        help='number of changesets analysed in each run')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each concurrency level')
+    parser.add_argument('--user-cache', action='store_true',
+                        help='keep the user details in the cache of the client')
+    parser.add_argument('--save', metavar='FILE', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='accepted fraction of regression in --compare')
+    args = parser.parse_args()
+
+    settings = {
+        'latency': args.latency, 'jitter': args.jitter, 'size': args.size,
+        'user_cache': args.user_cache,
+        }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            parser.error('the settings differ from the baseline: {}'.format(
+                baseline['settings']
+                ))
+
+    server = start_server(args.recordings, args.latency, args.jitter)
+    changesets = list(islice(cycle(recorded_changesets(args.recordings)), args.size))
+    results = {'version': __version__, 'settings': settings, 'levels': []}
+    print('{:>11} {:>14} {:>9} {:>9}'.format(
+        'concurrency', 'changesets/s', 'p50 ms', 'p99 ms'
+        ))
+    try:
+        for concurrency in args.concurrency:
+            runs = [
+                run_level(server.api_url, changesets, concurrency, args.user_cache)
+                for _ in range(args.repeat)
+                ]
+            level = max(runs, key=lambda run: run['changesets_per_second'])
+            level['p50_ms'] = min(run['p50_ms'] for run in runs)
+            level['p99_ms'] = min(run['p99_ms'] for run in runs)
+            results['levels'].append(level)
+            print('{concurrency:>11} {changesets_per_second:>14} {p50_ms:>9} '
+                  '{p99_ms:>9}'.format(**level))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print('Regression: ' + message)
+        if regressions:
+            sys.exit(1)
+        print('No regressions compared to {}'.format(args.compare))
+
+
+if __name__ == '__main__':
+    main()
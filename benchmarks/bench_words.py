@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Compare the time to verify the suspect words of the changesets with the
+regular expressions built by make_regex on each call and with a WordMatcher.
+
+Usage: python benchmarks/bench_words.py [replication_file] [--size 100000]
+"""
+import argparse
+import re
+from itertools import cycle, islice
+from time import perf_counter
+
+from osmcha.changeset import WORDS, ChangesetList, make_regex
+from osmcha.words import WordMatcher
+
+
+def previous_verify_words(comment, source, imagery_used, suspect_words,
+                          excluded_words, illegal_sources):
+    """The verification made by Analyse.verify_words before WordMatcher."""
+    text = comment.lower()
+    suspect = len(re.findall(make_regex(suspect_words), text))
+    excluded = len(re.findall(make_regex(excluded_words), text))
+    if suspect > excluded:
+        return True
+    for word in illegal_sources:
+        if word in source.lower():
+            if word == 'yandex' and 'yandex panorama' in source.lower():
+                pass
+            elif word == 'яндекс' and ('яндекс панорам' in source.lower() or 'яндекс.панорам' in source.lower()):
+                pass
+            else:
+                return True
+    for word in illegal_sources:
+        if word in imagery_used.lower():
+            return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('replication_file', nargs='?', default='tests/245.osm.gz')
+    parser.add_argument('--size', type=int, default=100000,
+                        help='number of changesets verified, repeating the file')
+    args = parser.parse_args()
+
+    changesets = [
+        (ch.get('comment', ''), ch.get('source', ''), ch.get('imagery_used', ''))
+        for ch in ChangesetList(args.replication_file).changesets
+        ]
+    corpus = list(islice(cycle(changesets), args.size))
+    suspect_words = WORDS['common'] + WORDS['sources']
+    lists = (suspect_words, WORDS['exclude'], WORDS['sources'])
+
+    start = perf_counter()
+    previous = [previous_verify_words(*fields, *lists) for fields in corpus]
+    previous_time = perf_counter() - start
+
+    start = perf_counter()
+    matcher = WordMatcher(*lists)
+    current = [bool(matcher.scan(*fields)) for fields in corpus]
+    current_time = perf_counter() - start
+
+    print(f'{len(changesets)} distinct changesets, {len(corpus)} verified')
+    print(f'make_regex:  {previous_time:.3f}s ({len(corpus) / previous_time:.0f}/s)')
+    print(f'WordMatcher: {current_time:.3f}s ({len(corpus) / current_time:.0f}/s)')
+    print(f'speedup: {previous_time / current_time:.1f}x')
+    print(f'same results: {previous == current}')
+
+
+if __name__ == '__main__':
+    main()
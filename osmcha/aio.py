@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Asyncio versions of the functions that access the OSM API. They require the
+aiohttp package, which can be installed with: pip install osmcha[async]
+"""
+import asyncio
+import xml.etree.ElementTree as ET
+from time import perf_counter
+from urllib.parse import quote
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from osmcha.cache import TTLCache
+from osmcha.changeset import (
+    Analyse, ChangeCounter, changeset_info, user_suspicion_reasons
+    )
+from osmcha.client import OSM_API, OSM_REQUEST_HEADERS
+from osmcha.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS, api_endpoint
+from osmcha.timing import Timings, record_bytes, record_nested_stage, record_request
+
+
+class AsyncOSMClient(object):
+    """Asyncio client of the OSM API. It works like OSMClient, but uses an
+    aiohttp ClientSession, so thousands of requests can share a single event
+    loop. Use it as an async context manager or call close() when finished.
+    """
+
+    def __init__(self, api_url=OSM_API, pool_size=100, timeout=60,
+                 headers=None, user_cache=None, changeset_cache=None):
+        """
+        Args:
+            api_url (str): the base URL of the API, without trailing slash.
+            pool_size (int): maximum number of simultaneous connections.
+            timeout (float): total timeout of each request in seconds.
+            headers (dict): extra headers sent in all requests.
+            user_cache: a TTLCache to keep the details of the users. By
+                default, it keeps 10000 users for one hour.
+            changeset_cache: a DiskCache to keep the metadata and the content
+                of the closed changesets. By default, nothing is saved. The
+                files are read and written in threads, so they don't block
+                the event loop.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                'AsyncOSMClient requires aiohttp. Install it with: pip install osmcha[async]'
+                )
+        self.api_url = api_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.headers = dict(OSM_REQUEST_HEADERS, **(headers or {}))
+        if user_cache is None:
+            user_cache = TTLCache(maxsize=10000, ttl=3600, name='users')
+        self.user_cache = user_cache
+        self.changeset_cache = changeset_cache
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def get_session(self):
+        # the session needs to be created inside the event loop
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+                )
+        return self.session
+
+    async def get(self, path):
+        """Make a GET request to a path of the API, like '/changeset/1', and
+        return a (status, content) tuple.
+        """
+        async with self.request(path) as response:
+            content = await response.read()
+        record_request(len(content))
+        return response.status, content
+
+    def request(self, path):
+        """Return the async context manager of a GET request to a path of
+        the API, which gives the aiohttp response, to read it as a stream.
+        """
+        return _Request(self, path)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class _Request(object):
+    """Async context manager of a request of AsyncOSMClient that registers
+    it in the HTTP metrics.
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self._context = None
+
+    async def __aenter__(self):
+        endpoint = api_endpoint(self.path)
+        start = perf_counter()
+        self._context = self.client.get_session().get(
+            self.client.api_url + self.path
+            )
+        try:
+            response = await self._context.__aenter__()
+        except Exception:
+            HTTP_REQUESTS.inc(endpoint=endpoint, status='error')
+            raise
+        HTTP_REQUEST_SECONDS.observe(perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status)
+        return response
+
+    async def __aexit__(self, *args):
+        return await self._context.__aexit__(*args)
+
+
+async def get_metadata(changeset, client):
+    """Get the metadata of a changeset and return it as a XML ElementTree.
+    See osmcha.changeset.get_metadata.
+    """
+    cache = client.changeset_cache
+    key = f'changeset-{changeset}'
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, key)
+        if content is not None:
+            return ET.fromstring(content)[0]
+
+    status, content = await client.get(f'/changeset/{changeset}')
+    metadata = ET.fromstring(content)[0]
+    if cache is not None and status == 200 and metadata.get('open') == 'false':
+        await asyncio.to_thread(cache.set, key, content)
+    return metadata
+
+
+async def get_changeset(changeset, client):
+    """Get the content of a changeset and return it as a XML ElementTree. See
+    osmcha.changeset.get_changeset.
+    """
+    cache = client.changeset_cache
+    key = f'changeset-{changeset}-download'
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, key)
+        if content is not None:
+            return ET.fromstring(content)
+
+    status, content = await client.get(f'/changeset/{changeset}/download')
+    if (cache is not None and status == 200
+            and await asyncio.to_thread(cache.__contains__, f'changeset-{changeset}')):
+        await asyncio.to_thread(cache.set, key, content)
+    return ET.fromstring(content)
+
+
+async def get_changeset_counts(changeset, client, chunk_size=65536, closed=False):
+    """Count the elements created, modified and deleted by a changeset while
+    it is downloaded. See osmcha.changeset.get_changeset_counts.
+    """
+    cache = client.changeset_cache
+    key = f'changeset-{changeset}-download'
+    counter = ChangeCounter()
+    content = None
+    if cache is not None:
+        content = await asyncio.to_thread(cache.get, key)
+    if content is not None:
+        counter.feed(content)
+    else:
+        path = f'/changeset/{changeset}/download'
+        async with client.request(path) as response:
+            record_request()
+            if (cache is not None and response.status == 200
+                    and (closed or await asyncio.to_thread(
+                        cache.__contains__, f'changeset-{changeset}'
+                        ))):
+                content = await response.read()
+                await asyncio.to_thread(cache.set, key, content)
+                record_bytes(len(content))
+                counter.feed(content)
+            else:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    record_bytes(len(chunk))
+                    counter.feed(chunk)
+    counts = counter.close()
+    record_nested_stage('parse', counter.seconds)
+    return counts
+
+
+async def fetch_user_details(user_id, client):
+    status, content = await client.get(f'/user/{quote(str(user_id))}')
+    if status == 200:
+        return user_suspicion_reasons(ET.fromstring(content)[0])
+
+
+async def get_user_details(user_id, client):
+    """Return the list of suspicion reasons related to a user. The results are
+    kept in the user_cache of the client and concurrent requests of the same
+    user are coalesced. See osmcha.changeset.get_user_details.
+    """
+    try:
+        reasons = await client.user_cache.get_or_compute_async(
+            str(user_id), lambda: fetch_user_details(user_id, client)
+            )
+    except Exception as e:
+        message = 'Could not verify user of the changeset: {}, {}'
+        print(message.format(user_id, str(e)))
+        return []
+    return list(reasons or [])
+
+
+async def timed(timings, name, coroutine):
+    """Await a coroutine measuring it as a stage of the timings."""
+    with timings.stage(name):
+        return await coroutine
+
+
+async def full_analysis(ch, client):
+    """Request the content of the changeset and the details of its user
+    concurrently and execute the full analysis of an Analyse object.
+    """
+    user_details = timed(ch.timings, 'user', get_user_details(ch.uid, client))
+    if ch.count_is_decided():
+        counts, user_reasons = None, await user_details
+    else:
+        counts, user_reasons = await asyncio.gather(
+            timed(ch.timings, 'download', get_changeset_counts(
+                ch.id, client, closed=ch.is_open is False
+                )),
+            user_details
+            )
+    ch.full_analysis(user_reasons=user_reasons, counts=counts)
+    return ch
+
+
+async def analyse(changeset, client, **kwargs):
+    """Create an Analyse object, execute the full analysis and return it.
+
+    Args:
+        changeset: a changeset id or a dict returned by changeset_info.
+        client: an AsyncOSMClient.
+        kwargs: other arguments accepted by Analyse, like the thresholds.
+    """
+    timings = Timings(kwargs.get('timing_hook'))
+    if type(changeset) in [int, str]:
+        changeset = changeset_info(
+            await timed(timings, 'metadata', get_metadata(changeset, client))
+            )
+    ch = Analyse(changeset, **kwargs)
+    for name, stage in timings.stages.items():
+        ch.timings.add(name, **stage)
+    return await full_analysis(ch, client)
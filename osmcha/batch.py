@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+
+from osmcha.changeset import Analyse, get_metadata_many, get_users_details
+from osmcha.client import get_default_client
+
+
+AnalysisResult = namedtuple('AnalysisResult', ['changeset', 'analyse', 'error'])
+AnalysisResult.__doc__ = """Result of the analysis of a changeset. If the
+analysis failed, analyse is None and error has the exception."""
+
+
+def analyse_changeset(changeset, **kwargs):
+    """Create an Analyse object, execute the full analysis and return it."""
+    ch = Analyse(changeset, **kwargs)
+    ch.full_analysis()
+    return ch
+
+
+def with_metadata(changesets, client=None, chunk_size=100):
+    """Take the changesets of an iterable in chunks and yield tuples with each
+    changeset and the changeset_info of it, fetching the metadata of the ids
+    of each chunk with a single request. Changesets that are already dicts and
+    ids that were not found by the API are yielded unchanged, so the analysis
+    will request their metadata individually.
+
+    Args:
+        changesets: an iterable of changeset ids or of changeset_info dicts.
+        client: the OSMClient used to make the requests.
+        chunk_size (int): number of changesets taken from the iterable at a
+            time.
+    """
+    changesets = iter(changesets)
+    while True:
+        chunk = list(islice(changesets, chunk_size))
+        if not chunk:
+            return
+        ids = [str(ch) for ch in chunk if not isinstance(ch, Mapping)]
+        metadata = {}
+        if ids:
+            try:
+                for info in get_metadata_many(ids, client, chunk_size):
+                    metadata[info['id']] = info
+            except Exception as e:
+                print(f"Error retrieving the metadata of changesets {ids[0]}-{ids[-1]}: {e}")
+        for ch in chunk:
+            if isinstance(ch, Mapping):
+                yield ch, ch
+            else:
+                yield ch, metadata.get(str(ch), ch)
+
+
+def with_user_details(items, client=None, chunk_size=100):
+    """Take the (changeset, changeset_info) tuples of an iterable in chunks,
+    request the details of the distinct users of each chunk with the
+    multi-user query and yield the tuples unchanged. The user details are
+    kept in the user_cache of the client, where the analyses will find them.
+
+    Args:
+        items: an iterable of (changeset, changeset_info) tuples, like the
+            ones yielded by with_metadata.
+        client: the OSMClient used to make the requests.
+        chunk_size (int): number of tuples taken from the iterable at a time.
+    """
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        uids = [
+            info['uid'] for _, info in chunk
+            if isinstance(info, Mapping) and info.get('uid')
+            ]
+        if uids:
+            get_users_details(uids, client, chunk_size)
+        yield from chunk
+
+
+def analyse_many(changesets, workers=8, client=None, bulk_metadata=True,
+                 bulk_users=True, chunk_size=100, **kwargs):
+    """Analyse many changesets concurrently and yield an AnalysisResult for
+    each one as soon as its analysis completes, so the results are not in the
+    same order as the changesets. Only a limited number of changesets are
+    taken from the iterable at a time, so it can be a generator.
+
+    Args:
+        changesets: an iterable of changeset ids or of the dicts returned by
+            changeset_info, like the ChangesetList changesets.
+        workers (int): maximum number of changesets analysed at the same time.
+        client: the OSMClient shared by all analyses. Its pool_size should not
+            be smaller than the number of workers.
+        bulk_metadata (bool): fetch the metadata of the changeset ids in
+            chunks with the multi-changeset query of the OSM API, instead of
+            making one request per changeset.
+        bulk_users (bool): fetch the details of the users of the changesets
+            in chunks with the multi-user query of the OSM API, instead of
+            making one request per user.
+        chunk_size (int): number of changesets in each metadata or user
+            request.
+        kwargs: other arguments accepted by Analyse, like the thresholds.
+    """
+    client = client or get_default_client()
+    if bulk_metadata:
+        changesets = with_metadata(changesets, client, chunk_size)
+    else:
+        changesets = ((ch, ch) for ch in changesets)
+    if bulk_users:
+        changesets = with_user_details(changesets, client, chunk_size)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    running = {}
+
+    def submit(item):
+        changeset, info = item
+        future = executor.submit(analyse_changeset, info, client=client, **kwargs)
+        running[future] = changeset
+
+    try:
+        for item in islice(changesets, workers):
+            submit(item)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                changeset = running.pop(future)
+                for item in islice(changesets, 1):
+                    submit(item)
+                try:
+                    yield AnalysisResult(changeset, future.result(), None)
+                except Exception as e:
+                    yield AnalysisResult(changeset, None, e)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
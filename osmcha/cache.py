@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+import gzip
+from collections import OrderedDict
+from concurrent.futures import Future
+from os import listdir, makedirs, remove, replace, stat, utime
+from os.path import getsize, join
+from tempfile import mkstemp
+from threading import Lock
+from time import monotonic, time
+
+from osmcha.metrics import CACHE_REQUESTS
+
+
+# seconds after which a temporary file of DiskCache is considered abandoned
+STALE_TMP_AGE = 3600
+
+
+class TTLCache(object):
+    """Thread-safe in-memory cache with a maximum number of items, least
+    recently used eviction and an expiration time. Concurrent calls to
+    get_or_compute or get_or_compute_async with the same key are coalesced,
+    so the value is computed only once.
+    """
+
+    def __init__(self, maxsize=10000, ttl=3600, timer=monotonic, name='ttl'):
+        """
+        Args:
+            maxsize (int): maximum number of items kept in the cache.
+            ttl (float): number of seconds that an item is valid.
+            timer: function that returns the current time in seconds.
+            name (str): the cache label of the osmcha_cache_requests_total
+                metric.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._data = OrderedDict()
+        self._in_flight = {}
+        self._async_in_flight = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        """Verify if the key has a valid value without counting a hit or a
+        miss."""
+        with self._lock:
+            return self._get(key)[0]
+
+    def _get(self, key):
+        """Return a (found, value) tuple. Must be called with the lock held."""
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            return False, None
+        if expires <= self.timer():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _set(self, key, value):
+        """Must be called with the lock held."""
+        if self.maxsize <= 0:
+            return
+        self._data[key] = (self.timer() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._get(key)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        CACHE_REQUESTS.inc(cache=self.name, result='hit' if found else 'miss')
+        return value if found else default
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def get_or_compute(self, key, function):
+        """Return the cached value of the key or call the function to compute
+        it. If another thread is already computing the same key, wait for its
+        result instead of calling the function again. None values and
+        exceptions are not cached.
+        """
+        with self._lock:
+            found, value = self._get(key)
+            if found:
+                self.hits += 1
+            else:
+                future = self._in_flight.get(key)
+                if future is not None:
+                    self.coalesced += 1
+                else:
+                    self.misses += 1
+                    owner_future = self._in_flight[key] = Future()
+        if found:
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return value
+        if future is not None:
+            CACHE_REQUESTS.inc(cache=self.name, result='coalesced')
+            return future.result()
+        CACHE_REQUESTS.inc(cache=self.name, result='miss')
+
+        try:
+            value = function()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            owner_future.set_exception(e)
+            raise
+        with self._lock:
+            if value is not None:
+                self._set(key, value)
+            del self._in_flight[key]
+        owner_future.set_result(value)
+        return value
+
+    async def get_or_compute_async(self, key, function):
+        """Like get_or_compute, but for asyncio code: function returns a
+        coroutine, which is awaited only once for concurrent calls with the
+        same key, and the event loop is not blocked while it runs.
+        """
+        import asyncio
+
+        owner = False
+        with self._lock:
+            found, value = self._get(key)
+            if found:
+                self.hits += 1
+            else:
+                task = self._async_in_flight.get(key)
+                if task is not None:
+                    self.coalesced += 1
+                else:
+                    self.misses += 1
+                    owner = True
+                    task = self._async_in_flight[key] = asyncio.ensure_future(
+                        function()
+                        )
+        if found:
+            CACHE_REQUESTS.inc(cache=self.name, result='hit')
+            return value
+        if owner:
+            CACHE_REQUESTS.inc(cache=self.name, result='miss')
+            task.add_done_callback(lambda task: self._finish_async(key, task))
+        else:
+            CACHE_REQUESTS.inc(cache=self.name, result='coalesced')
+        # the task continues for the other callers if this one is cancelled
+        return await asyncio.shield(task)
+
+    def _finish_async(self, key, task):
+        with self._lock:
+            del self._async_in_flight[key]
+            if not task.cancelled() and task.exception() is None:
+                value = task.result()
+                if value is not None:
+                    self._set(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return a dict with the number of hits, misses, coalesced calls and
+        items of the cache.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'size': len(self._data),
+            }
+
+
+class DiskCache(object):
+    """Cache stored in a local folder, where each item is a gzip compressed
+    file. When the size of the folder exceeds max_size, the least recently
+    used files are removed until it is below low_water times max_size, so
+    the folder is not scanned again on the next writes. It is used to keep the OSM API responses of the
+    closed changesets, which never change.
+    """
+
+    def __init__(self, path, max_size=1024 ** 3, name='disk', low_water=0.9):
+        """
+        Args:
+            path (str): path to the folder. It is created if it doesn't exist.
+            max_size (int): maximum size of the folder in bytes.
+            name (str): the cache label of the osmcha_cache_requests_total
+                metric.
+            low_water (float): fraction of max_size that the folder has after
+                an eviction.
+        """
+        self.name = name
+        self.path = path
+        self.max_size = max_size
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        makedirs(path, exist_ok=True)
+        self._remove_stale_files()
+        self._size = sum(getsize(join(path, f)) for f in self._files())
+
+    def _remove_stale_files(self):
+        """Remove the temporary files left by writes that were interrupted.
+        The recent ones can belong to another process using the folder.
+        """
+        for name in listdir(self.path):
+            if not name.endswith('.tmp'):
+                continue
+            try:
+                filename = join(self.path, name)
+                if time() - stat(filename).st_mtime > STALE_TMP_AGE:
+                    remove(filename)
+            except FileNotFoundError:
+                pass
+
+    def _files(self):
+        return [f for f in listdir(self.path) if f.endswith('.gz')]
+
+    def _filename(self, key):
+        return join(self.path, '{}.gz'.format(key))
+
+    def __contains__(self, key):
+        try:
+            stat(self._filename(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, key):
+        """Return the content of the key as bytes or None if it is not
+        cached.
+        """
+        filename = self._filename(key)
+        try:
+            with gzip.open(filename, 'rb') as f:
+                content = f.read()
+            # the modification time registers the last use of the file
+            utime(filename)
+        except FileNotFoundError:
+            self.misses += 1
+            CACHE_REQUESTS.inc(cache=self.name, result='miss')
+            return None
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache=self.name, result='hit')
+        return content
+
+    def set(self, key, content):
+        """Save the content of the key, replacing the file atomically."""
+        filename = self._filename(key)
+        # each writer has its own temporary file, so concurrent writes of the
+        # same key don't overwrite or move each other's file
+        fd, tmp_file = mkstemp(dir=self.path, prefix='{}.'.format(key), suffix='.tmp')
+        try:
+            with open(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(content)
+        except BaseException:
+            remove(tmp_file)
+            raise
+        with self._lock:
+            try:
+                self._size -= getsize(filename)
+            except FileNotFoundError:
+                pass
+            replace(tmp_file, filename)
+            self._size += getsize(filename)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Remove the least recently used files until the folder size is below
+        low_water times max_size. Must be called with the lock held.
+        """
+        files = []
+        for name in self._files():
+            try:
+                info = stat(join(self.path, name))
+            except FileNotFoundError:
+                continue
+            files.append((info.st_mtime, info.st_size, name))
+        target = self.max_size * self.low_water
+        for mtime, size, name in sorted(files):
+            if self._size <= target:
+                break
+            try:
+                remove(join(self.path, name))
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def size(self):
+        """Return the size of the cached files in bytes."""
+        return self._size
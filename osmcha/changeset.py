@@ -1,49 +1,47 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, unicode_literals
 import gzip
-import json
-import re
-from urllib.request import urlretrieve
-from os import environ
+import sys
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
 from datetime import datetime
-from os.path import basename, join, isfile, dirname, abspath
-from shutil import rmtree
-from tempfile import mkdtemp
+from os.path import isfile
+from time import perf_counter
 import xml.etree.ElementTree as ET
+from urllib.parse import quote
 
-import yaml
-import requests
-from shapely.geometry import Polygon
-from . import __version__ as version
+from osmcha.client import (  # noqa: F401
+    OSM_API, OSM_REQUEST_HEADERS, OSM_SERVER_URL, get_default_client
+    )
+from osmcha.metrics import (
+    ANALYSES, ANALYSIS_SECONDS, CHANGESETS_PARSED, SUSPICION_REASONS
+    )
+from osmcha.timing import Timings, record_bytes, record_nested_stage
+from osmcha.warnings import WARNINGS
+from osmcha.words import (
+    SUSPECT_WORDS_FILE, get_matcher, get_word_list, load_words
+    )
 
-from osmcha.warnings import Warnings
+
+def __getattr__(name):
+    # the word lists are only read when they are used for the first time
+    if name == 'WORDS':
+        globals()['WORDS'] = load_words(SUSPECT_WORDS_FILE)
+        return globals()['WORDS']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
-# Python 2 has 'failobj' instead of 'default'
-try:
-    SUSPECT_WORDS_FILE = environ.get(
-        'SUSPECT_WORDS',
-        default=join(dirname(abspath(__file__)), 'suspect_words.yaml')
-        )
-except TypeError:
-    SUSPECT_WORDS_FILE = environ.get(
-        'SUSPECT_WORDS',
-        failobj=join(dirname(abspath(__file__)), 'suspect_words.yaml')
-        )
-WORDS = yaml.safe_load(open(SUSPECT_WORDS_FILE, 'r').read())
-OSM_SERVER_URL = environ.get(
-    'OSM_SERVER_URL',
-    default='https://www.openstreetmap.org'
-    )
-OSM_API = '{}/api/0.6'.format(OSM_SERVER_URL)
-OSM_REQUEST_HEADERS = {'User-Agent': f'OSMCha osmcha {version}'}
 # infosrmation that we get from changeset xml key
 MANDATORY_TAGS = ['id', 'user', 'uid', 'bbox', 'created_at', 'comments_count']
+ACTIONS = ('create', 'modify', 'delete')
+ELEMENT_TYPES = ('node', 'way', 'relation')
 # fields that will be removed on the Analyse.get_dict() method
 FIELDS_TO_REMOVE = [
     'create_threshold', 'modify_threshold', 'illegal_sources',
     'delete_threshold', 'percentage', 'top_threshold', 'suspect_words',
-    'excluded_words', 'warning_tags', 'host', 'review_requested'
+    'excluded_words', 'warning_tags', 'host', 'review_requested', 'regions',
+    '_client', 'changes_count', 'skip_small_changesets', 'counts_fetched',
+    'warning_index', 'timings', 'is_open', 'word_snapshot'
     ]
 
 
@@ -51,72 +49,479 @@ class InvalidChangesetError(Exception):
     pass
 
 
-def get_user_details(user_id):
+def get_user_details(user_id, client=None):
     """Get information about the number of changesets, blocks and mapping days
-    of a user, using the OSM API.
+    of a user, using the OSM API. The results are kept in the user_cache of
+    the client.
+
+    Args:
+        user_id: the id of the user.
+        client: the OSMClient used to make the request. If it is not defined,
+            the default client is used.
     """
-    reasons = []
+    client = client or get_default_client()
     try:
-        url = f'{OSM_API}/user/{requests.compat.quote(user_id)}'
-        user_request = requests.get(url, headers=OSM_REQUEST_HEADERS)
-        if user_request.status_code == 200:
-            user_data = user_request.content
-            xml_data = ET.fromstring(user_data)[0]
-            changesets = [i for i in xml_data if i.tag == 'changesets'][0]
-            blocks = [i for i in xml_data if i.tag == 'blocks'][0]
-            if int(changesets.get('count')) <= 50:
-                reasons.append('New mapper')
-            if int(blocks[0].get('count')) > 1:
-                reasons.append('User has multiple blocks')
+        reasons = client.user_cache.get_or_compute(
+            str(user_id), lambda: fetch_user_details(user_id, client)
+            )
     except Exception as e:
         message = 'Could not verify user of the changeset: {}, {}'
         print(message.format(user_id, str(e)))
-    return reasons
+        return []
+    return list(reasons or [])
+
+
+def get_users_details(user_ids, client=None, chunk_size=100):
+    """Get the details of many users using the multi-user query of the OSM
+    API and return a dict with the suspicion reasons of each user id. Only the
+    users that are not in the user_cache of the client are requested, and the
+    results are added to it, so the next calls to get_user_details don't need
+    to make any request. Users that were not found are not in the dict.
+
+    Args:
+        user_ids: a list of user ids.
+        client: the OSMClient used to make the requests. If it is not
+            defined, the default client is used.
+        chunk_size (int): number of users requested at a time.
+    """
+    client = client or get_default_client()
+    cache = client.user_cache
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    missing = [user_id for user_id in user_ids if user_id not in cache]
+    for i in range(0, len(missing), chunk_size):
+        chunk = missing[i:i + chunk_size]
+        try:
+            response = client.get('/users', params={'users': ','.join(chunk)})
+            response.raise_for_status()
+            for user in ET.fromstring(response.content):
+                if user.tag == 'user':
+                    cache.set(user.get('id'), user_suspicion_reasons(user))
+        except Exception as e:
+            message = 'Could not verify the users: {}-{}, {}'
+            print(message.format(chunk[0], chunk[-1], str(e)))
+
+    result = {}
+    for user_id in user_ids:
+        reasons = cache.get(user_id)
+        if reasons is not None:
+            result[user_id] = list(reasons)
+    return result
+
+
+def fetch_user_details(user_id, client):
+    """Request the details of a user to the OSM API and return a tuple with
+    the suspicion reasons related to the user or None if the request fails.
+    """
+    user_request = client.get(f'/user/{quote(str(user_id))}')
+    if user_request.status_code == 200:
+        return user_suspicion_reasons(ET.fromstring(user_request.content)[0])
+
+
+def user_suspicion_reasons(user):
+    """Return a tuple with the suspicion reasons related to a user.
+
+    Args:
+        user: the XML element of the user returned by the OSM API.
+    """
+    reasons = []
+    changesets = [i for i in user if i.tag == 'changesets'][0]
+    blocks = [i for i in user if i.tag == 'blocks'][0]
+    if int(changesets.get('count')) <= 50:
+        reasons.append('New mapper')
+    if int(blocks[0].get('count')) > 1:
+        reasons.append('User has multiple blocks')
+    return tuple(reasons)
+
+
+class ChangesetRecord(MutableMapping):
+    """Compact representation of the metadata of a changeset that behaves like
+    the dict previously returned by changeset_info. The bounds are stored as
+    four floats and the bbox Polygon is only built when it is accessed for the
+    first time. Likewise, the creation date is parsed lazily. The tag keys are
+    interned, so the records share the strings of the repeated keys.
+
+    Like in a dict, any key can be deleted, including id, bbox and the other
+    mandatory keys. The open status of the changeset is kept in the is_open
+    attribute, which is not a key of the record.
+    """
+    __slots__ = (
+        'id', 'user', 'uid', 'created_at', 'comments_count', 'changes_count',
+        'min_lon', 'min_lat', 'max_lon', 'max_lat', 'is_open', '_keys',
+        '_values', '_bbox', '_date'
+        )
+    fields = ('id', 'user', 'uid', 'created_at', 'comments_count')
+
+    def __init__(self, id, user, uid, created_at, comments_count, bounds=None,
+                 tags=(), changes_count=None, is_open=None):
+        """
+        Args:
+            bounds: a (min_lon, min_lat, max_lon, max_lat) tuple or None if
+                the changeset has no coordinates.
+            tags: a list of (key, value) tuples.
+            changes_count: the number of changes of the changeset or None if
+                it is unknown. The key is only present when it is known.
+            is_open: True if the changeset is open, False if it is closed or
+                None if it is unknown.
+        """
+        self.id = id
+        self.user = user
+        self.uid = uid
+        self.created_at = created_at
+        self.comments_count = comments_count
+        self.changes_count = changes_count
+        self.is_open = is_open
+        self.min_lon, self.min_lat, self.max_lon, self.max_lat = (
+            bounds or (None, None, None, None)
+            )
+        tags = [(k, v) for k, v in tags if k not in MANDATORY_TAGS]
+        self._keys = tuple(sys.intern(k) for k, v in tags)
+        self._values = tuple(v for k, v in tags)
+        self._bbox = None
+        self._date = None
+
+    @classmethod
+    def from_xml(cls, changeset):
+        """Create a record from the XML element of a changeset."""
+        try:
+            bounds = (
+                float(changeset.get('min_lon')), float(changeset.get('min_lat')),
+                float(changeset.get('max_lon')), float(changeset.get('max_lat'))
+                )
+        except TypeError:
+            bounds = None
+        # the replication files name the changes_count as num_changes
+        changes_count = changeset.get('changes_count', changeset.get('num_changes'))
+        is_open = changeset.get('open')
+        if is_open is not None:
+            is_open = is_open == 'true'
+        elif changeset.get('closed_at') is not None:
+            is_open = False
+        return cls(
+            changeset.get('id'), changeset.get('user'), changeset.get('uid'),
+            changeset.get('created_at'), changeset.get('comments_count'),
+            bounds, [(tag.get('k'), tag.get('v')) for tag in changeset],
+            changes_count, is_open
+            )
+
+    @property
+    def bbox(self):
+        if self._bbox is None:
+            self._bbox = make_bbox(
+                self.min_lon, self.min_lat, self.max_lon, self.max_lat
+                )
+        return self._bbox
+
+    @property
+    def date(self):
+        if self._date is None:
+            self._date = parse_date(self.created_at)
+        return self._date
+
+    def _slot(self, key):
+        """Return the slot of a mandatory key."""
+        return '_bbox' if key == 'bbox' else key
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if key == 'bbox':
+            if not hasattr(self, '_bbox'):
+                raise KeyError(key)
+            return self.bbox
+        if key == 'changes_count' and self.changes_count is not None:
+            return self.changes_count
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.fields or key == 'changes_count':
+            setattr(self, key, value)
+        elif key == 'bbox':
+            self._bbox = value
+        elif key in self._keys:
+            values = list(self._values)
+            values[self._keys.index(key)] = value
+            self._values = tuple(values)
+        else:
+            self._keys += (sys.intern(key),)
+            self._values += (value,)
+
+    def __delitem__(self, key):
+        # the slots of the deleted mandatory keys are left unset
+        if key in MANDATORY_TAGS:
+            try:
+                delattr(self, self._slot(key))
+            except AttributeError:
+                raise KeyError(key)
+            return
+        if key == 'changes_count' and self.changes_count is not None:
+            self.changes_count = None
+            return
+        if key not in self._keys:
+            raise KeyError(key)
+        index = self._keys.index(key)
+        self._keys = self._keys[:index] + self._keys[index + 1:]
+        self._values = self._values[:index] + self._values[index + 1:]
+
+    def __iter__(self):
+        yield from self._keys
+        for key in MANDATORY_TAGS:
+            if hasattr(self, self._slot(key)):
+                yield key
+        if self.changes_count is not None:
+            yield 'changes_count'
+
+    def __len__(self):
+        return (
+            len(self._keys)
+            + sum(hasattr(self, self._slot(key)) for key in MANDATORY_TAGS)
+            + (self.changes_count is not None)
+            )
+
+    def __contains__(self, key):
+        if key == 'changes_count':
+            return self.changes_count is not None
+        if key in MANDATORY_TAGS:
+            return hasattr(self, self._slot(key))
+        return key in self._keys
+
+    def copy(self):
+        """Return a shallow copy of the record, like dict.copy. Changing the
+        copy doesn't change the original record.
+        """
+        record = self.__class__.__new__(self.__class__)
+        for slot in self.__slots__:
+            if hasattr(self, slot):
+                setattr(record, slot, getattr(self, slot))
+        return record
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, dict(self))
 
 
 def changeset_info(changeset):
-    """Return a dictionary with id, user, user_id, bounds, date of creation,
-    comments_count and all the tags of the changeset.
+    """Return a ChangesetRecord, a dict-like object with id, user, user_id,
+    bounds, date of creation, comments_count and all the tags of the changeset.
 
     Args:
         changeset: the XML string of the changeset.
     """
-    keys = [tag.attrib.get('k') for tag in changeset]
-    keys += MANDATORY_TAGS
-    values = [tag.attrib.get('v') for tag in changeset]
-    values += [
-        changeset.get('id'), changeset.get('user'), changeset.get('uid'),
-        get_bounds(changeset), changeset.get('created_at'),
-        changeset.get('comments_count')
-        ]
+    return ChangesetRecord.from_xml(changeset)
+
 
-    return dict(zip(keys, values))
+def parse_date(date):
+    """Convert a timestamp in the format used by the OSM API to datetime."""
+    return datetime.strptime(date, '%Y-%m-%dT%H:%M:%SZ')
 
 
-def get_changeset(changeset):
+def get_changeset(changeset, client=None):
     """Get the changeset using the OSM API and return the content as a XML
-    ElementTree.
+    ElementTree. If the client has a changeset_cache, the content is cached
+    when the metadata of the changeset was cached before, what means that
+    it is closed.
 
     Args:
         changeset: the id of the changeset.
+        client: the OSMClient used to make the request. If it is not defined,
+            the default client is used.
     """
-    url = f'{OSM_API}/changeset/{changeset}/download'
-    return ET.fromstring(
-        requests.get(url, headers=OSM_REQUEST_HEADERS).content
-        )
+    client = client or get_default_client()
+    cache = client.changeset_cache
+    key = f'changeset-{changeset}-download'
+    if cache is not None:
+        content = cache.get(key)
+        if content is not None:
+            return ET.fromstring(content)
+
+    response = client.get(f'/changeset/{changeset}/download')
+    if (cache is not None and response.status_code == 200
+            and f'changeset-{changeset}' in cache):
+        cache.set(key, response.content)
+    return ET.fromstring(response.content)
+
+
+class ChangeCounter(object):
+    """Count the elements created, modified and deleted by an osmChange
+    document, by type of element. The document can be fed in chunks as it is
+    downloaded and the parsed elements are discarded, so the memory usage
+    doesn't depend on the size of the changeset. The time spent parsing is
+    kept in the seconds attribute.
+    """
+
+    def __init__(self):
+        self.seconds = 0
+        self.counts = {
+            action: {element_type: 0 for element_type in ELEMENT_TYPES}
+            for action in ACTIONS
+            }
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._depth = 0
+        self._root = None
+        self._action_element = None
+        self._action = None
 
+    def feed(self, data):
+        """Parse a chunk of the document."""
+        start = perf_counter()
+        self._parser.feed(data)
+        self._read_events()
+        self.seconds += perf_counter() - start
 
-def get_metadata(changeset):
+    def close(self):
+        """Finish the parsing and return the counts."""
+        start = perf_counter()
+        self._parser.close()
+        self._read_events()
+        self.seconds += perf_counter() - start
+        return self.counts
+
+    def _read_events(self):
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._depth == 1:
+                    self._root = element
+                elif self._depth == 2:
+                    self._action_element = element
+                    self._action = self.counts.get(element.tag)
+                elif self._depth == 3 and self._action is not None:
+                    if element.tag in self._action:
+                        self._action[element.tag] += 1
+            else:
+                self._depth -= 1
+                if self._depth == 2:
+                    # an action can have any number of elements, so they are
+                    # removed from it as soon as they end
+                    element.clear()
+                    self._action_element.remove(element)
+                elif self._depth == 1:
+                    self._root.clear()
+
+
+def count_changes(xml):
+    """Return the counts of a osmChange XML ElementTree in the same format of
+    ChangeCounter.
+    """
+    counts = ChangeCounter().counts
+    for action in xml:
+        for element in action:
+            if action.tag in counts and element.tag in counts[action.tag]:
+                counts[action.tag][element.tag] += 1
+    return counts
+
+
+def get_changeset_counts(changeset, client=None, chunk_size=65536, closed=False):
+    """Download the changeset using the OSM API and count the elements
+    created, modified and deleted by it with a ChangeCounter, without keeping
+    the whole content in memory. If the client has a changeset_cache, the
+    content is cached like in get_changeset or when closed is True.
+
+    Args:
+        changeset: the id of the changeset.
+        client: the OSMClient used to make the request. If it is not defined,
+            the default client is used.
+        chunk_size (int): number of bytes read at a time.
+        closed (bool): the changeset is known to be closed, like when its
+            metadata comes from a replication file, so its content can be
+            cached even if the metadata is not in the cache.
+    """
+    client = client or get_default_client()
+    cache = client.changeset_cache
+    key = f'changeset-{changeset}-download'
+    counter = ChangeCounter()
+    content = cache.get(key) if cache is not None else None
+    if content is not None:
+        counter.feed(content)
+    else:
+        with client.get(f'/changeset/{changeset}/download', stream=True) as response:
+            if (cache is not None and response.status_code == 200
+                    and (closed or f'changeset-{changeset}' in cache)):
+                cache.set(key, response.content)
+                record_bytes(len(response.content))
+                counter.feed(response.content)
+            else:
+                for chunk in response.iter_content(chunk_size):
+                    record_bytes(len(chunk))
+                    counter.feed(chunk)
+    counts = counter.close()
+    record_nested_stage('parse', counter.seconds)
+    return counts
+
+
+def get_metadata(changeset, client=None):
     """Get the metadata of a changeset using the OSM API and return it as a XML
-    ElementTree.
+    ElementTree. If the client has a changeset_cache, the metadata of the
+    closed changesets is cached.
 
     Args:
         changeset: the id of the changeset.
+        client: the OSMClient used to make the request. If it is not defined,
+            the default client is used.
     """
-    url = f'{OSM_API}/changeset/{changeset}'
-    return ET.fromstring(
-        requests.get(url, headers=OSM_REQUEST_HEADERS).content
-        )[0]
+    client = client or get_default_client()
+    cache = client.changeset_cache
+    key = f'changeset-{changeset}'
+    if cache is not None:
+        content = cache.get(key)
+        if content is not None:
+            return ET.fromstring(content)[0]
+
+    response = client.get(f'/changeset/{changeset}')
+    metadata = ET.fromstring(response.content)[0]
+    if (cache is not None and response.status_code == 200
+            and metadata.get('open') == 'false'):
+        cache.set(key, response.content)
+    return metadata
+
+
+def get_metadata_many(changesets, client=None, chunk_size=100):
+    """Get the metadata of many changesets using the multi-changeset query of
+    the OSM API, which returns up to 100 changesets per request. Yield the
+    changeset_info of each changeset found, in the order returned by the API.
+    If the client has a changeset_cache, the cached changesets are not
+    requested and the closed ones are cached.
+
+    Args:
+        changesets: a list of changeset ids.
+        client: the OSMClient used to make the requests. If it is not
+            defined, the default client is used.
+        chunk_size (int): number of changesets requested at a time.
+    """
+    client = client or get_default_client()
+    cache = client.changeset_cache
+    changesets = [str(changeset) for changeset in changesets]
+    if cache is not None:
+        missing = []
+        for changeset in changesets:
+            content = cache.get(f'changeset-{changeset}')
+            if content is None:
+                missing.append(changeset)
+            else:
+                yield changeset_info(ET.fromstring(content)[0])
+        changesets = missing
+
+    for i in range(0, len(changesets), chunk_size):
+        response = client.get(
+            '/changesets',
+            params={'changesets': ','.join(changesets[i:i + chunk_size])}
+            )
+        response.raise_for_status()
+        for metadata in ET.fromstring(response.content):
+            if metadata.tag != 'changeset':
+                continue
+            if cache is not None and metadata.get('open') == 'false':
+                cache.set(
+                    'changeset-{}'.format(metadata.get('id')),
+                    '<osm>{}</osm>'.format(
+                        ET.tostring(metadata, encoding='unicode')
+                        ).encode('utf-8')
+                    )
+            yield changeset_info(metadata)
 
 
 def get_bounds(changeset):
@@ -127,18 +532,157 @@ def get_bounds(changeset):
     Args:
         changeset: the XML string of the changeset.
     """
+    return make_bbox(
+        changeset.get('min_lon'), changeset.get('min_lat'),
+        changeset.get('max_lon'), changeset.get('max_lat')
+        )
+
+
+def make_bbox(min_lon, min_lat, max_lon, max_lat):
+    """Return a Polygon with the bounds or an empty Polygon if some of them is
+    None.
+    """
+    from shapely.geometry import Polygon
+
     try:
         return Polygon([
-            (float(changeset.get('min_lon')), float(changeset.get('min_lat'))),
-            (float(changeset.get('max_lon')), float(changeset.get('min_lat'))),
-            (float(changeset.get('max_lon')), float(changeset.get('max_lat'))),
-            (float(changeset.get('min_lon')), float(changeset.get('max_lat'))),
-            (float(changeset.get('min_lon')), float(changeset.get('min_lat'))),
+            (float(min_lon), float(min_lat)),
+            (float(max_lon), float(min_lat)),
+            (float(max_lon), float(max_lat)),
+            (float(min_lon), float(max_lat)),
+            (float(min_lon), float(min_lat)),
             ])
     except TypeError:
         return Polygon()
 
 
+@contextmanager
+def open_replication_file(changeset_file):
+    """Open a gzipped replication changeset file and return a file-like object
+    with its uncompressed content. Remote files are not saved to the disk: the
+    HTTP response is decompressed as it is read, so the parsing can start
+    before the download finishes.
+
+    Args:
+        changeset_file (str): the URL or the path to a local replication file.
+    """
+    if isfile(changeset_file):
+        with gzip.open(changeset_file) as f:
+            yield f
+    else:
+        import requests
+
+        response = requests.get(
+            changeset_file, headers=OSM_REQUEST_HEADERS, stream=True
+            )
+        try:
+            response.raise_for_status()
+            # undo any Content-Encoding, the file itself is still gzipped
+            response.raw.decode_content = True
+            with gzip.GzipFile(fileobj=response.raw) as f:
+                yield f
+        finally:
+            response.close()
+
+
+def iterparse_changesets(changeset_file):
+    """Parse a replication changeset file incrementally and yield the XML
+    element of each changeset. An element is cleared as soon as the next one is
+    requested, so the memory usage does not grow with the size of the file.
+
+    Args:
+        changeset_file: a file-like object with the uncompressed XML content of
+            a replication changeset file.
+    """
+    context = ET.iterparse(changeset_file, events=('start', 'end'))
+    _, root = next(context)
+    for event, element in context:
+        if event == 'end' and element.tag == 'changeset':
+            CHANGESETS_PARSED.inc()
+            yield element
+            element.clear()
+            root.clear()
+
+
+def get_bounds_array(changesets):
+    """Return a NumPy array with one (min_lon, min_lat, max_lon, max_lat) row
+    for each changeset. The changesets without coordinates are filled with NaN.
+
+    Args:
+        changesets: a list of changeset XML elements.
+    """
+    import numpy as np
+
+    return np.array([
+        [
+            ch.get('min_lon', 'nan'), ch.get('min_lat', 'nan'),
+            ch.get('max_lon', 'nan'), ch.get('max_lat', 'nan')
+            ]
+        for ch in changesets
+        ], dtype=float).reshape(-1, 4)
+
+
+def make_changeset_filter(created_after=None, created_before=None,
+                          is_open=None, uids=None, tags=None, bbox=None):
+    """Return a function that receives the XML element of a changeset and
+    returns True if it matches all the defined criteria. The verifications use
+    only the raw XML attributes, so they are much cheaper than building the
+    changeset_info dict.
+
+    Args:
+        created_after: a datetime or a string in the '%Y-%m-%dT%H:%M:%SZ'
+            format. Only changesets created at or after it will match.
+        created_before: a datetime or a string in the '%Y-%m-%dT%H:%M:%SZ'
+            format. Only changesets created before it will match.
+        is_open (bool): match only the open (True) or closed (False)
+            changesets.
+        uids: a list or set with the ids of the users.
+        tags: a list of tag keys that the changeset needs to have.
+        bbox: a (min_lon, min_lat, max_lon, max_lat) tuple. Only changesets
+            whose bounds intersect with it will match.
+    """
+    predicates = []
+    # the timestamps have a fixed format, so we can compare the strings
+    if created_after is not None:
+        if isinstance(created_after, datetime):
+            created_after = created_after.strftime('%Y-%m-%dT%H:%M:%SZ')
+        predicates.append(lambda ch: ch.get('created_at') >= created_after)
+    if created_before is not None:
+        if isinstance(created_before, datetime):
+            created_before = created_before.strftime('%Y-%m-%dT%H:%M:%SZ')
+        predicates.append(lambda ch: ch.get('created_at') < created_before)
+    if is_open is not None:
+        is_open = 'true' if is_open else 'false'
+        predicates.append(lambda ch: ch.get('open') == is_open)
+    if uids is not None:
+        uids = {str(uid) for uid in uids}
+        predicates.append(lambda ch: ch.get('uid') in uids)
+    if tags is not None:
+        tags = set(tags)
+        predicates.append(lambda ch: tags.issubset(tag.get('k') for tag in ch))
+    if bbox is not None:
+        predicates.append(lambda ch: _bounds_intersect(ch, bbox))
+
+    def matches(changeset):
+        return all(predicate(changeset) for predicate in predicates)
+
+    return matches
+
+
+def _bounds_intersect(changeset, bbox):
+    """Return True if the bounds of the changeset XML element intersect with
+    the (min_lon, min_lat, max_lon, max_lat) bbox. Changesets without bounds
+    never intersect.
+    """
+    try:
+        return not (float(changeset.get('max_lon')) < bbox[0]
+                    or float(changeset.get('max_lat')) < bbox[1]
+                    or float(changeset.get('min_lon')) > bbox[2]
+                    or float(changeset.get('min_lat')) > bbox[3])
+    except TypeError:
+        return False
+
+
 def make_regex(words):
     """Concatenate a list of words in a regular expression. The regex is made to
     check if a text has words that starts with any word in the list.
@@ -157,7 +701,8 @@ def find_words(text, suspect_words, excluded_words=[]):
     search, so you can remove false positives like 'important' be detected when
     you search by 'import'. It will return True if the number of suspect words
     found is greater than the number of excluded words. Otherwise, it will
-    return False.
+    return False. The words are compiled in a WordMatcher, which is reused in
+    the next calls with the same lists.
 
     Args:
         text (str): a string with the text to be analysed. It will be converted
@@ -166,30 +711,18 @@ def find_words(text, suspect_words, excluded_words=[]):
             the text.
         excluded_words: a list of strings to be whitelisted.
     """
-    text = text.lower()
-    suspect_found = [i for i in re.finditer(make_regex(suspect_words), text)]
-    if len(excluded_words) > 0:
-        excluded_found = [
-            i for i in re.finditer(make_regex(excluded_words), text)
-            ]
-        if len(suspect_found) > len(excluded_found):
-            return True
-        else:
-            return False
-    else:
-        if len(suspect_found) > 0:
-            return True
-        else:
-            return False
+    return bool(get_matcher(suspect_words, excluded_words).find_words(text))
 
 
 class ChangesetList(object):
     """Read replication changeset file and return a list with the XML data of
     each changeset. You can filter the changesets by passing a geojson file
-    with a Polygon of your area of interest.
+    with the Polygons or MultiPolygons of your areas of interest. In that case,
+    the 'regions' key of each changeset lists the names of the features it
+    intersects with.
     """
 
-    def __init__(self, changeset_file, geojson=None):
+    def __init__(self, changeset_file, geojson=None, stream=False):
         """Read the changeset replication file, filter it you define a polygon
         with your area of interest in a geojson file and define the .changesets
         with the data of all changesets included in the replication file.
@@ -198,51 +731,112 @@ class ChangesetList(object):
             changeset_file (str): it can be the URL of a replication file in
                 https://planet.openstreetmap.org/replication/changesets/ or the
                 path to a local replication file.
-            geojson (str): path to a local geojson file containing a polygon.
-                The area of the polygon will be used to filter the changesets,
-                returning only the ones that intersect with it.
+            geojson (str): path to a local geojson file containing one or more
+                Polygon or MultiPolygon features. The changesets will be
+                filtered, returning only the ones that intersect with any of
+                the features.
+            stream (bool): if True, the file is not read on the initialization
+                and .changesets is not defined. Use the iter_changesets method
+                to parse the file incrementally instead.
         """
-        self.read_file(changeset_file)
+        self.changeset_file = changeset_file
+        self.area = None
+        self.regions = None
         if geojson:
             self.get_area(geojson)
+        if stream:
+            return
+
+        self.read_file(changeset_file)
+        if geojson:
             self.filter()
         else:
             self.content = self.xml
-        self.changesets = [changeset_info(ch) for ch in self.content]
+            self.changesets = [self.read_changeset(ch) for ch in self.content]
+
+    def iter_changesets(self, **filters):
+        """Yield the changeset_info dict of each changeset that intersects with
+        the area of interest and matches the filters. In the stream mode, the
+        replication file is parsed incrementally and only one changeset is
+        kept in memory at a time.
+
+        The filters are verified on the XML attributes before building the
+        dict, so the discarded changesets are cheap. See
+        make_changeset_filter for the accepted arguments. Example:
+
+            c.iter_changesets(is_open=False, tags=['review_requested'])
+        """
+        matches = make_changeset_filter(**filters) if filters else None
+        if hasattr(self, 'content'):
+            # the eager mode has already filtered the changesets by the area
+            for changeset, info in zip(self.content, self.changesets):
+                if matches is None or matches(changeset):
+                    yield info
+            return
+
+        with open_replication_file(self.changeset_file) as f:
+            for changeset in iterparse_changesets(f):
+                if matches is not None and not matches(changeset):
+                    continue
+                # like filter, only build the geometry of the changesets
+                # whose bounds are close to some region
+                if self.regions is not None and not self.regions.envelope_mask(
+                        get_bounds_array([changeset]))[0]:
+                    continue
+                info = self.read_changeset(changeset)
+                if info is not None:
+                    yield info
+
+    def read_changeset(self, changeset):
+        """Return the changeset_info dict of a changeset. If a geojson was
+        defined, the names of the regions that the changeset intersects with
+        are added to the 'regions' key and None is returned if it is outside
+        of all regions.
+
+        Args:
+            changeset: the XML element of the changeset.
+        """
+        info = changeset_info(changeset)
+        if self.regions is not None:
+            info['regions'] = self.regions.query(info['bbox'])
+            if not info['regions']:
+                return None
+        return info
 
     def read_file(self, changeset_file):
         """Download the replication changeset file or read it directly from the
         filesystem (to test purposes).
         """
-        if isfile(changeset_file):
-            self.filename = changeset_file
-        else:
-            self.path = mkdtemp()
-            self.filename = join(self.path, basename(changeset_file))
-            urlretrieve(changeset_file, self.filename)
-
-        self.xml = ET.fromstring(gzip.open(self.filename).read())
-
-        # delete folder created to download the file
-        if not isfile(changeset_file):
-            rmtree(self.path)
+        with open_replication_file(changeset_file) as f:
+            self.xml = ET.parse(f).getroot()
+        CHANGESETS_PARSED.inc(len(self.xml.findall('changeset')))
 
     def get_area(self, geojson):
-        """Read the first feature from the geojson and return it as a Polygon
-        object.
+        """Read the Polygon and MultiPolygon features from the geojson and
+        index them in a RegionIndex.
         """
-        geojson = json.load(open(geojson, 'r'))
-        self.area = Polygon(
-            geojson['features'][0]['geometry']['coordinates'][0]
-            )
+        from osmcha.regions import RegionIndex
+
+        self.regions = RegionIndex.from_geojson(geojson)
+        self.area = self.regions.area
 
     def filter(self):
-        """Filter the changesets that intersect with the geojson geometry."""
-        self.content = [
-            ch
-            for ch in self.xml
-            if get_bounds(ch).intersects(self.area)
-            ]
+        """Filter the changesets that intersect with the geojson geometries
+        and define .content and .changesets with their XML elements and their
+        changeset_info dicts. The bounding boxes of all changesets are compared
+        with the envelopes of the regions at once, so the exact intersection is
+        only verified, once, for the changesets that are close to some region.
+        """
+        candidates = self.regions.envelope_mask(get_bounds_array(self.xml))
+        self.content = []
+        self.changesets = []
+        for ch, candidate in zip(self.xml, candidates):
+            if not candidate:
+                continue
+            info = self.read_changeset(ch)
+            if info is not None:
+                self.content.append(ch)
+                self.changesets.append(info)
 
 
 class Analyse(object):
@@ -250,11 +844,38 @@ class Analyse(object):
 
     def __init__(self, changeset, create_threshold=200, modify_threshold=200,
                  delete_threshold=30, percentage=0.7, top_threshold=1000,
-                 suspect_words=WORDS['common'] + WORDS['sources'],
-                 illegal_sources=WORDS['sources'], excluded_words=WORDS['exclude']):
+                 suspect_words=None, illegal_sources=None, excluded_words=None,
+                 client=None, skip_small_changesets=False, warning_index=None,
+                 timing_hook=None):
+        """
+        Args:
+            suspect_words, illegal_sources, excluded_words: the word lists
+                used by verify_words. The lists that are not defined are taken
+                from the current version of the default WordList.
+            client: the OSMClient used to make the requests. If it is not
+                defined, the default client is created when the first request
+                is made, so an Analyse that receives all the data, like in
+                osmcha.aio, doesn't create it.
+            skip_small_changesets (bool): don't download the content of the
+                changesets whose changes_count is not greater than any of the
+                thresholds, as they can't be a possible import, mass
+                modification or mass deletion. The create, modify and delete
+                counts of these changesets are None.
+            warning_index: the WarningIndex used to verify the warnings tags
+                of the changeset. By default, the DEFAULT_WARNINGS are used.
+            timing_hook: a function called with the name and a dict with the
+                seconds, requests and bytes of each stage of the analysis when
+                it finishes. The sum of each stage is kept in timings.
+        """
+        self.timings = Timings(timing_hook)
+        self._client = client
+        self.skip_small_changesets = skip_small_changesets
+        self.warning_index = warning_index or WARNINGS
         if type(changeset) in [int, str]:
-            self.set_fields(changeset_info(get_metadata(changeset)))
-        elif type(changeset) is dict:
+            with self.timings.stage('metadata'):
+                changeset = changeset_info(get_metadata(changeset, self.client))
+            self.set_fields(changeset)
+        elif isinstance(changeset, Mapping):
             self.set_fields(changeset)
         else:
             raise InvalidChangesetError(
@@ -267,9 +888,26 @@ class Analyse(object):
         self.delete_threshold = delete_threshold
         self.percentage = percentage
         self.top_threshold = top_threshold
-        self.excluded_words = excluded_words
-        self.illegal_sources = illegal_sources
-        self.suspect_words = suspect_words
+        words = self.word_snapshot = get_word_list().snapshot()
+        self.excluded_words = (
+            words.excluded_words if excluded_words is None else excluded_words
+            )
+        self.illegal_sources = (
+            words.illegal_sources if illegal_sources is None else illegal_sources
+            )
+        self.suspect_words = (
+            words.suspect_words if suspect_words is None else suspect_words
+            )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_default_client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
 
     def set_fields(self, changeset):
         """Set the class attributes with the metadata of the analysed
@@ -286,10 +924,16 @@ class Analyse(object):
         self.comments_count = int(changeset.get('comments_count', 0))
         self.source = changeset.get('source', 'Not reported')
         self.imagery_used = changeset.get('imagery_used', 'Not reported')
-        self.date = datetime.strptime(
-            changeset.get('created_at'),
-            '%Y-%m-%dT%H:%M:%SZ'
-            )
+        self.regions = changeset.get('regions', [])
+        changes_count = changeset.get('changes_count')
+        self.changes_count = int(changes_count) if changes_count is not None else None
+        self.counts_fetched = False
+        self.is_open = getattr(changeset, 'is_open', None)
+        if isinstance(changeset, ChangesetRecord):
+            # the record keeps the parsed date
+            self.date = changeset.date
+        else:
+            self.date = parse_date(changeset.get('created_at'))
         self.suspicion_reasons = []
         self.is_suspect = False
         self.powerfull_editor = False
@@ -317,54 +961,68 @@ class Analyse(object):
         self.suspicion_reasons.append(reason)
         self.is_suspect = True
 
-    def full_analysis(self):
-        """Execute the count and verify methods."""
-        self.count()
+    def full_analysis(self, xml=None, user_reasons=None, counts=None):
+        """Execute the count and verify methods. The content of the changeset
+        and the user details are requested to the OSM API unless they are
+        passed as arguments.
+
+        Args:
+            xml: the osmChange XML ElementTree returned by get_changeset.
+            user_reasons: the list returned by get_user_details.
+            counts: the dict returned by get_changeset_counts, which can be
+                used instead of the xml.
+        """
+        self.count(xml, counts)
         self.verify_words()
-        self.verify_user()
+        self.verify_user(user_reasons)
         self.verify_warning_tags()
 
         if self.review_requested == 'yes':
             self.label_suspicious('Review requested')
 
+        ANALYSES.inc(suspect=str(self.is_suspect).lower())
+        ANALYSIS_SECONDS.observe(self.timings.total)
+        for reason in self.suspicion_reasons:
+            SUSPICION_REASONS.inc(reason=reason)
+
     def verify_warning_tags(self):
-        w = Warnings()
-        for item in [w.is_enabled(reason) for reason in self.warning_tags]:
-            if item is not None:
-                self.label_suspicious(item)
+        with self.timings.stage('warnings'):
+            reasons = self.warning_index.resolve(self.warning_tags)
+        for reason in reasons:
+            self.label_suspicious(reason)
 
-    def verify_user(self):
+    def verify_user(self, user_reasons=None):
         """Verify if the changeset was created by a inexperienced mapper
         (anyone with less than 5 edits) or by a user that was blocked more
         than once.
+
+        Args:
+            user_reasons: the list returned by get_user_details. If it is not
+                defined, the user details are requested to the OSM API.
         """
-        user_reasons = get_user_details(self.uid)
+        if user_reasons is None:
+            with self.timings.stage('user'):
+                user_reasons = get_user_details(self.uid, self.client)
         [self.label_suspicious(reason) for reason in user_reasons]
 
     def verify_words(self):
         """Verify the fields source, imagery_used and comment of the changeset
         for some suspect words.
         """
-        if self.comment:
-            if find_words(self.comment, self.suspect_words, self.excluded_words):
-                self.label_suspicious('suspect_word')
-
-        if self.source:
-            for word in self.illegal_sources:
-                if word in self.source.lower():
-                    if word == 'yandex' and 'yandex panorama' in self.source.lower():
-                        pass
-                    elif word == 'яндекс' and ('яндекс панорам' in self.source.lower() or 'яндекс.панорам' in self.source.lower()):
-                        pass
-                    else:
-                        self.label_suspicious('suspect_word')
-                        break
-
-        if self.imagery_used:
-            for word in self.illegal_sources:
-                if word in self.imagery_used.lower():
-                    self.label_suspicious('suspect_word')
-                    break
+        with self.timings.stage('words'):
+            words = self.word_snapshot
+            if (self.suspect_words is words.suspect_words
+                    and self.excluded_words is words.excluded_words
+                    and self.illegal_sources is words.illegal_sources):
+                # the default lists use the matcher compiled with them
+                matcher = words.matcher
+            else:
+                matcher = get_matcher(
+                    self.suspect_words, self.excluded_words, self.illegal_sources
+                    )
+            found = matcher.scan(self.comment, self.source, self.imagery_used)
+        if found:
+            self.label_suspicious('suspect_word')
 
         self.suspicion_reasons = list(set(self.suspicion_reasons))
 
@@ -384,34 +1042,76 @@ class Analyse(object):
             self.powerfull_editor = True
             self.label_suspicious('Software editor was not declared')
 
-    def count(self):
+    def count_is_decided(self):
+        """Return True if skip_small_changesets is enabled and the
+        changes_count of the changeset is not greater than any threshold, so
+        the count can't label it as suspect.
+        """
+        return (
+            self.skip_small_changesets and self.changes_count is not None
+            and self.changes_count <= min(
+                self.create_threshold, self.modify_threshold,
+                self.delete_threshold, self.top_threshold
+                )
+            )
+
+    def count(self, xml=None, counts=None):
         """Count the number of elements created, modified and deleted by the
         changeset and analyses if it is a possible import, mass modification or
-        a mass deletion.
+        a mass deletion. The number of elements of each type is kept in
+        element_counts. If count_is_decided returns True, the changeset is not
+        downloaded, the counts are set to None and counts_fetched stays False.
+
+        Args:
+            xml: the osmChange XML ElementTree returned by get_changeset.
+            counts: the dict returned by get_changeset_counts. If neither the
+                xml nor the counts are defined, the changeset is downloaded
+                from the OSM API and counted while it is downloaded.
         """
-        xml = get_changeset(self.id)
-        actions = [action.tag for action in xml]
-        self.create = actions.count('create')
-        self.modify = actions.count('modify')
-        self.delete = actions.count('delete')
+        if xml is None and counts is None and self.count_is_decided():
+            self.create = self.modify = self.delete = None
+            self.element_counts = None
+            self.verify_editor()
+            return
+        if counts is None:
+            if xml is None:
+                with self.timings.stage('download'):
+                    counts = get_changeset_counts(
+                        self.id, self.client, closed=self.is_open is False
+                        )
+            else:
+                with self.timings.stage('count'):
+                    counts = count_changes(xml)
+        self.counts_fetched = True
+        self.element_counts = counts
+        self.create = sum(counts['create'].values())
+        self.modify = sum(counts['modify'].values())
+        self.delete = sum(counts['delete'].values())
+        total = self.create + self.modify + self.delete
         self.verify_editor()
 
         try:
-            if (self.create / len(actions) > self.percentage
+            if (self.create / total > self.percentage
                     and self.create > self.create_threshold
                     and (self.powerfull_editor or self.create > self.top_threshold)):
                 self.label_suspicious('possible import')
-            elif (self.modify / len(actions) > self.percentage
+            elif (self.modify / total > self.percentage
                     and self.modify > self.modify_threshold):
                 self.label_suspicious('mass modification')
-            elif ((self.delete / len(actions) > self.percentage
+            elif ((self.delete / total > self.percentage
                     and self.delete > self.delete_threshold) or
                     self.delete > self.top_threshold):
                 self.label_suspicious('mass deletion')
         except ZeroDivisionError:
             print('It seems this changeset was redacted')
 
-    def get_dict(self):
+    def get_dict(self, include_timings=False):
+        """Return a dict with the results of the analysis.
+
+        Args:
+            include_timings (bool): add the timings of the stages of the
+                analysis in the 'timings' key.
+        """
         ch_dict = self.__dict__.copy()
         for key in self.__dict__:
             if self.__dict__.get(key) == '':
@@ -422,4 +1122,6 @@ class Analyse(object):
                 ch_dict.pop(field)
             except KeyError:
                 pass
+        if include_timings:
+            ch_dict['timings'] = self.timings.as_dict()
         return ch_dict
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from os import environ
+from time import perf_counter
+
+from . import __version__ as version
+from osmcha.cache import TTLCache
+from osmcha.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS, api_endpoint
+from osmcha.timing import record_request
+
+
+OSM_SERVER_URL = environ.get(
+    'OSM_SERVER_URL',
+    default='https://www.openstreetmap.org'
+    )
+OSM_API = '{}/api/0.6'.format(OSM_SERVER_URL)
+OSM_REQUEST_HEADERS = {'User-Agent': f'OSMCha osmcha {version}'}
+
+
+class OSMClient(object):
+    """Client of the OSM API. It keeps a requests Session with a pool of
+    keep-alive connections, so the requests made to analyse the changesets
+    reuse the same TCP and TLS connections. The details of the users are kept
+    in the user_cache, as the same users are verified many times. Optionally,
+    the responses about closed changesets can be kept in a changeset_cache.
+    """
+
+    def __init__(self, api_url=OSM_API, pool_size=10, timeout=(10, 60),
+                 headers=None, session=None, user_cache=None,
+                 changeset_cache=None):
+        """
+        Args:
+            api_url (str): the base URL of the API, without trailing slash.
+            pool_size (int): maximum number of connections kept open to the
+                server. Use the number of threads that share the client.
+            timeout: the connect and read timeouts in seconds, as accepted by
+                requests.
+            headers (dict): extra headers sent in all requests.
+            session: a requests.Session to be used instead of a new one.
+            user_cache: a TTLCache to keep the details of the users. By
+                default, it keeps 10000 users for one hour.
+            changeset_cache: a DiskCache to keep the metadata and the content
+                of the closed changesets. By default, nothing is saved.
+        """
+        # requests is imported here to keep the import of osmcha fast
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(OSM_REQUEST_HEADERS)
+        self.session.headers.update(headers or {})
+        if user_cache is None:
+            user_cache = TTLCache(maxsize=10000, ttl=3600, name='users')
+        self.user_cache = user_cache
+        self.changeset_cache = changeset_cache
+
+    def get(self, path, **kwargs):
+        """Make a GET request to a path of the API, like '/changeset/1', and
+        return the requests Response.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = api_endpoint(path)
+        start = perf_counter()
+        try:
+            response = self.session.get(self.api_url + path, **kwargs)
+        except Exception:
+            HTTP_REQUESTS.inc(endpoint=endpoint, status='error')
+            raise
+        HTTP_REQUEST_SECONDS.observe(perf_counter() - start, endpoint=endpoint)
+        HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        # the content of the streamed responses is counted while it is read
+        record_request(0 if kwargs.get('stream') else len(response.content))
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+
+
+def get_default_client():
+    """Return the client used when no client is passed to the functions that
+    access the OSM API. It is created on the first call.
+    """
+    global _default_client
+    if _default_client is None:
+        _default_client = OSMClient()
+    return _default_client
+
+
+def set_default_client(client):
+    """Replace the client used when no client is passed to the functions that
+    access the OSM API.
+    """
+    global _default_client
+    _default_client = client
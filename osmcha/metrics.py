@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Counters and histograms of the work done by osmcha, rendered in the
+Prometheus text exposition format. The metrics are kept in the memory of the
+process, so a long running worker can expose them with start_http_server or
+with the web framework it already uses:
+
+    from osmcha.metrics import REGISTRY
+    body = REGISTRY.render()
+"""
+import re
+from bisect import bisect_left
+from threading import Lock, Thread
+
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+    )
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '{}="{}"'.format(name, _escape(value)) for name, value in pairs
+        )
+
+
+class Metric(object):
+    """Base class of the metrics. The values of each combination of labels
+    are kept in a dict, so only the combinations that were used are rendered.
+    """
+
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        """
+        Args:
+            name (str): the name of the metric, like 'osmcha_analyses_total'.
+            help (str): the description of the metric.
+            labelnames: the names of the labels that must be passed to each
+                update of the metric.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def _key(self, labels):
+        if len(labels) == len(self.labelnames):
+            try:
+                return tuple([str(labels[name]) for name in self.labelnames])
+            except KeyError:
+                pass
+        raise ValueError('{} requires the labels: {}'.format(
+            self.name, ', '.join(self.labelnames)
+            ))
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(
+                self.name, self.help.replace('\\', r'\\').replace('\n', r'\n')
+                ),
+            '# TYPE {} {}'.format(self.name, self.type),
+            ]
+        with self._lock:
+            items = sorted(self._values.items())
+            items = [(key, self._copy(value)) for key, value in items]
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(Metric):
+    """A value that only increases, like the number of analysed changesets."""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value of the labels."""
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, key, value):
+        yield '{}{} {}'.format(
+            self.name, _format_labels(self.labelnames, key), _format_value(value)
+            )
+
+
+class Histogram(Metric):
+    """Distribution of observed values, like the duration of the analyses,
+    counted in cumulative buckets, with the sum and the count of the values.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            buckets: the upper bounds of the buckets in increasing order. The
+                +Inf bucket is added to them.
+        """
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # the bucket of the value is the first one whose bound is not smaller
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                # the counts of each bucket and of +Inf, then the sum
+                data = self._values[key] = [0] * (len(self.buckets) + 1) + [0]
+            data[index] += 1
+            data[-1] += value
+
+    def count(self, **labels):
+        """Return the number of values observed with the labels."""
+        data = self._values.get(self._key(labels))
+        return sum(data[:-1]) if data else 0
+
+    def sum(self, **labels):
+        """Return the sum of the values observed with the labels."""
+        data = self._values.get(self._key(labels))
+        return data[-1] if data else 0
+
+    def _copy(self, value):
+        return list(value)
+
+    def _samples(self, key, data):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), data[:-1]):
+            cumulative += count
+            yield '{}_bucket{} {}'.format(
+                self.name,
+                _format_labels(self.labelnames, key, [('le', _format_value(bound))]),
+                cumulative
+                )
+        labels = _format_labels(self.labelnames, key)
+        yield '{}_sum{} {}'.format(self.name, labels, _format_value(data[-1]))
+        yield '{}_count{} {}'.format(self.name, labels, cumulative)
+
+
+class MetricsRegistry(object):
+    """A set of metrics that are rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def register(self, metric):
+        """Add a metric to the registry and return it. Registering another
+        metric with the same name raises a ValueError.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('The metric {} is already registered'.format(
+                    metric.name
+                    ))
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def clear(self):
+        """Reset the values of all the metrics."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def render(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+CHANGESETS_PARSED = REGISTRY.counter(
+    'osmcha_changesets_parsed_total',
+    'Number of changesets parsed from replication files.'
+    )
+ANALYSES = REGISTRY.counter(
+    'osmcha_analyses_total',
+    'Number of completed analyses by their result.',
+    ['suspect']
+    )
+ANALYSIS_SECONDS = REGISTRY.histogram(
+    'osmcha_analysis_duration_seconds',
+    'Duration of the completed analyses, including the requests.'
+    )
+SUSPICION_REASONS = REGISTRY.counter(
+    'osmcha_suspicion_reasons_total',
+    'Number of suspicion reasons added to the analysed changesets.',
+    ['reason']
+    )
+HTTP_REQUESTS = REGISTRY.counter(
+    'osmcha_http_requests_total',
+    'Number of requests made to the OSM API by endpoint and status code.',
+    ['endpoint', 'status']
+    )
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'osmcha_http_request_duration_seconds',
+    'Time until the response headers of the OSM API requests are received.',
+    ['endpoint']
+    )
+CACHE_REQUESTS = REGISTRY.counter(
+    'osmcha_cache_requests_total',
+    'Number of cache lookups by cache and result: hit, miss or coalesced.',
+    ['cache', 'result']
+    )
+
+
+_ids = re.compile(r'/\d+(?=/|$)')
+
+
+def api_endpoint(path):
+    """Return the path of an OSM API request without the query string and
+    with the ids replaced by {id}, so it can be used as a label.
+    """
+    return _ids.sub('/{id}', path.split('?', 1)[0])
+
+
+def start_http_server(port, address='', registry=REGISTRY):
+    """Serve the metrics of the registry on all paths of the port in a daemon
+    thread and return the server.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True, name='osmcha-metrics').start()
+    return server
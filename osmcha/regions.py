@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import json
+
+import numpy as np
+import shapely
+from shapely.geometry import GeometryCollection, shape
+from shapely.prepared import prep
+from shapely.strtree import STRtree
+
+
+class RegionIndex(object):
+    """Spatial index of a set of named regions. It uses a STRtree to select the
+    candidate regions and prepared geometries to verify the intersections, so a
+    geometry can be tested against dozens of detailed regions at once.
+    """
+
+    def __init__(self, regions):
+        """
+        Args:
+            regions: a list of (name, geometry) tuples. The geometries need to be
+                shapely Polygon or MultiPolygon objects.
+        """
+        self.names = [name for name, geometry in regions]
+        self.geometries = [geometry for name, geometry in regions]
+        self.prepared = [prep(geometry) for geometry in self.geometries]
+        self.tree = STRtree(self.geometries)
+        self.envelopes = shapely.bounds(self.geometries).reshape(-1, 4)
+
+    @classmethod
+    def from_geojson(cls, geojson):
+        """Create the index with the Polygon and MultiPolygon features of a
+        geojson file. The name of each region is read from the 'name' property
+        of the feature. Features without a name are identified by their
+        position in the file.
+
+        Args:
+            geojson (str): path to a local geojson file.
+        """
+        with open(geojson, 'r') as f:
+            features = json.load(f)['features']
+        return cls([
+            ((feature.get('properties') or {}).get('name', str(i)), shape(feature['geometry']))
+            for i, feature in enumerate(features)
+            if feature['geometry']['type'] in ['Polygon', 'MultiPolygon']
+            ])
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def area(self):
+        """Return a geometry with all the regions."""
+        return GeometryCollection(self.geometries)
+
+    def envelope_mask(self, bounds):
+        """Verify, at once, which bounding boxes overlap with the envelope of
+        at least one region. Return a boolean array with one value for each
+        bounding box.
+
+        Args:
+            bounds: a NumPy array with one (min_lon, min_lat, max_lon, max_lat)
+                row per bounding box. Rows containing NaN never overlap.
+        """
+        bounds = bounds[:, np.newaxis, :]
+        envelopes = self.envelopes[np.newaxis, :, :]
+        return (
+            (bounds[..., 0] <= envelopes[..., 2])
+            & (bounds[..., 2] >= envelopes[..., 0])
+            & (bounds[..., 1] <= envelopes[..., 3])
+            & (bounds[..., 3] >= envelopes[..., 1])
+            ).any(axis=1)
+
+    def candidates(self, geometry):
+        """Return the position of the regions whose envelope intersects with
+        the geometry.
+        """
+        return sorted(self.tree.query(geometry))
+
+    def query(self, geometry):
+        """Return the names of the regions that intersect with the geometry."""
+        if geometry.is_empty:
+            return []
+        return [
+            self.names[i] for i in self.candidates(geometry)
+            if self.prepared[i].intersects(geometry)
+            ]
+
+    def intersects(self, geometry):
+        """Return True if the geometry intersects with any region."""
+        if geometry.is_empty:
+            return False
+        return any(
+            self.prepared[i].intersects(geometry) for i in self.candidates(geometry)
+            )
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from os import replace
+from os.path import isfile
+from threading import Event
+
+import yaml
+import requests
+
+from osmcha.changeset import ChangesetList, OSM_REQUEST_HEADERS
+
+
+REPLICATION_URL = 'https://planet.openstreetmap.org/replication/changesets'
+
+
+def sequence_path(sequence):
+    """Return the path of a replication file relative to the replication
+    folder. Example: 2236374 returns '002/236/374.osm.gz'.
+
+    Args:
+        sequence (int): the sequence number of the replication file.
+    """
+    number = '{:09d}'.format(sequence)
+    return '{}/{}/{}.osm.gz'.format(number[:3], number[3:6], number[6:])
+
+
+class ReplicationFollower(object):
+    """Follow the changeset replication files, keeping the last processed
+    sequence number in a local checkpoint file. When the follower is restarted,
+    it catches up on all the sequences published since the checkpoint. With a
+    poll_interval, follow keeps verifying the state file for new sequences.
+    """
+
+    def __init__(self, checkpoint, replication_url=REPLICATION_URL,
+                 geojson=None, workers=4, start_sequence=None):
+        """
+        Args:
+            checkpoint (str): path to the local file where the last processed
+                sequence number is saved.
+            replication_url (str): URL or local path of the replication folder,
+                the one that contains the state.yaml file.
+            geojson (str): path to a geojson file used to filter the changesets
+                of each replication file. See ChangesetList.
+            workers (int): number of replication files downloaded and parsed in
+                parallel when catching up.
+            start_sequence (int): sequence to start from if the checkpoint file
+                does not exist. By default, it starts from the current sequence.
+        """
+        self.checkpoint = checkpoint
+        self.replication_url = replication_url.rstrip('/')
+        self.geojson = geojson
+        self.workers = workers
+        self.start_sequence = start_sequence
+        self._stop = Event()
+
+    def get_url(self, path):
+        return '{}/{}'.format(self.replication_url, path)
+
+    def read_state(self):
+        """Return the current sequence number of the replication."""
+        url = self.get_url('state.yaml')
+        if isfile(url):
+            with open(url, 'r') as f:
+                state = f.read()
+        else:
+            response = requests.get(url, headers=OSM_REQUEST_HEADERS)
+            response.raise_for_status()
+            state = response.text
+        return int(yaml.safe_load(state)['sequence'])
+
+    def read_checkpoint(self):
+        """Return the last processed sequence number or None if the checkpoint
+        file does not exist.
+        """
+        if not isfile(self.checkpoint):
+            return None
+        with open(self.checkpoint, 'r') as f:
+            return int(yaml.safe_load(f)['sequence'])
+
+    def write_checkpoint(self, sequence):
+        """Save the last processed sequence number. The file is replaced
+        atomically, so a crash never leaves a broken checkpoint.
+        """
+        tmp_file = '{}.tmp'.format(self.checkpoint)
+        with open(tmp_file, 'w') as f:
+            f.write('---\nsequence: {}\n'.format(sequence))
+        replace(tmp_file, self.checkpoint)
+
+    def pending_sequences(self):
+        """Return the range of sequences that were not processed yet."""
+        current = self.read_state()
+        last = self.read_checkpoint()
+        if last is not None:
+            start = last + 1
+        elif self.start_sequence is not None:
+            start = self.start_sequence
+        else:
+            start = current
+        return range(start, current + 1)
+
+    def fetch(self, sequence):
+        """Download, parse and filter a replication file and return the list of
+        its changesets.
+        """
+        return ChangesetList(
+            self.get_url(sequence_path(sequence)), self.geojson
+            ).changesets
+
+    def follow(self, poll_interval=None):
+        """Yield a (sequence, changesets) tuple for each pending sequence, in
+        the sequence order. The files are fetched in parallel, but the
+        checkpoint is only updated after the caller processes a sequence, so a
+        crash never skips a sequence.
+
+        Args:
+            poll_interval (float): if it is None, return after the pending
+                sequences are processed. Otherwise, verify the state file for
+                new sequences every poll_interval seconds until stop is
+                called. Errors reading the state or the replication files are
+                printed and the sequences are tried again on the next poll.
+        """
+        self._stop.clear()
+        if poll_interval is None:
+            yield from self.catch_up()
+            return
+        while not self._stop.is_set():
+            try:
+                yield from self.catch_up()
+            except Exception as e:
+                print('Could not read the replication files of {}: {}'.format(
+                    self.replication_url, e
+                    ))
+            self._stop.wait(poll_interval)
+
+    def stop(self):
+        """Make follow return after the sequence being processed."""
+        self._stop.set()
+
+    def catch_up(self):
+        """Yield a (sequence, changesets) tuple for each sequence pending when
+        it is called. See follow.
+        """
+        sequences = iter(self.pending_sequences())
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+
+        def submit(sequence):
+            return sequence, executor.submit(self.fetch, sequence)
+
+        try:
+            pending = deque(submit(i) for i in islice(sequences, self.workers))
+            while pending:
+                if self._stop.is_set():
+                    return
+                sequence, future = pending.popleft()
+                changesets = future.result()
+                next_sequence = next(sequences, None)
+                if next_sequence is not None:
+                    pending.append(submit(next_sequence))
+                yield sequence, changesets
+                self.write_checkpoint(sequence)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
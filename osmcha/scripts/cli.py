@@ -1,22 +1,232 @@
 # -*- coding: utf-8 -*-
+import json
+import sys
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain
+
 import click
 
-from osmcha.changeset import Analyse
+from osmcha import client as osm_client
+
+
+def read_ids(lines):
+    """Yield the changeset ids of the lines of a file, skipping the empty
+    lines and warning about the invalid ones.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield int(line)
+        except ValueError:
+            click.echo(f'Invalid changeset id in line {number}: {line}', err=True)
+
+
+def to_json(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
 
 
-@click.command('osmcha')
-@click.argument('id', type=int, metavar='changeset_id')
-def cli(id):
-    """Analyse an OpenStreetMap changeset."""
-    ch = Analyse(id)
-    ch.full_analysis()
+def print_summary(ch):
     click.echo(
         'Created: %s. Modified: %s. Deleted: %s' % (ch.create, ch.modify, ch.delete)
         )
     if ch.is_suspect:
         click.echo('The changeset {} is suspect! Reasons: {}'.format(
-            id,
+            ch.id,
             ', '.join(ch.suspicion_reasons)
             ))
     else:
-        click.echo('The changeset %s is not suspect!' % id)
+        click.echo('The changeset %s is not suspect!' % ch.id)
+
+
+def print_timings(ch):
+    click.echo('Timings (total: %.3fs):' % ch.timings.total)
+    for name, stage in ch.timings.stages.items():
+        click.echo('  {}: {:.3f}s, {} requests, {} bytes'.format(
+            name, stage['seconds'], stage['requests'], stage['bytes']
+            ))
+
+
+@contextmanager
+def profiled(path):
+    """Profile the code of the with block with cProfile, including the
+    threads started inside it, and save the stats in the path. Nothing is
+    done if the path is None.
+    """
+    if path is None:
+        yield
+        return
+    import cProfile
+    import pstats
+    import threading
+
+    profilers = [cProfile.Profile()]
+
+    def profile_thread(*args):
+        # replaces this function as the profiler of the new thread
+        profiler = cProfile.Profile()
+        profilers.append(profiler)
+        profiler.enable()
+
+    threading.setprofile(profile_thread)
+    profilers[0].enable()
+    try:
+        yield
+    finally:
+        profilers[0].disable()
+        threading.setprofile(None)
+        pstats.Stats(*profilers).dump_stats(path)
+        click.echo(f'Profile saved in {path}', err=True)
+
+
+class DefaultGroup(click.Group):
+    """Group that runs the default command when the first argument is not
+    the name of a command, so `osmcha 123` works like `osmcha analyse 123`.
+    """
+
+    def __init__(self, *args, default=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default = default
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and args[0] != '--help'):
+            args = [self.default] + list(args)
+        return super().parse_args(ctx, args)
+
+
+def print_results(results, regions=False, timings=False):
+    """Print a JSON line for each AnalysisResult and return the number of
+    results and of failed analyses.
+    """
+    analysed = failed = 0
+    for result in results:
+        analysed += 1
+        if result.error is None:
+            line = result.analyse.get_dict(include_timings=timings)
+            if regions:
+                line['regions'] = result.analyse.regions
+        else:
+            failed += 1
+            changeset = result.changeset
+            if isinstance(changeset, Mapping):
+                changeset = changeset['id']
+            line = {'id': int(changeset), 'error': str(result.error)}
+        click.echo(json.dumps(line, default=to_json, ensure_ascii=False))
+    return analysed, failed
+
+
+jobs_option = click.option(
+    '-j', '--jobs', type=click.IntRange(min=1), default=8, show_default=True,
+    help='Number of changesets analysed at the same time.'
+    )
+timings_option = click.option(
+    '--timings', is_flag=True,
+    help='Show the time, requests and bytes of each stage of the analyses.'
+    )
+profile_option = click.option(
+    '--profile', type=click.Path(dir_okay=False, writable=True),
+    help='Profile the command with cProfile and save the stats in the file.'
+    )
+
+
+@click.group('osmcha', cls=DefaultGroup, default='analyse')
+def cli():
+    """Analyse OpenStreetMap changesets.
+
+    Run `osmcha CHANGESET_ID...` to analyse changesets by their ids or
+    `osmcha replication FILE` to analyse the changesets of a replication file.
+    """
+
+
+@cli.command()
+@click.argument('ids', nargs=-1, type=int, metavar='[CHANGESET_ID]...')
+@click.option(
+    '-f', '--file', 'ids_file', type=click.File('r'),
+    help='Read the changeset ids from a file, one per line. Use - for stdin.'
+    )
+@jobs_option
+@click.option(
+    '--json', 'json_lines', is_flag=True,
+    help='Print the result as JSON even if there is a single changeset.'
+    )
+@timings_option
+@profile_option
+def analyse(ids, ids_file, jobs, json_lines, timings, profile):
+    """Analyse changesets by their ids.
+
+    With a single changeset id, a summary of the analysis is printed. With
+    many ids, a file of ids or ids piped to stdin, the changesets are analysed
+    concurrently and a JSON line is printed for each one as soon as its
+    analysis completes.
+    """
+    if ids_file is None and not ids and not sys.stdin.isatty():
+        ids_file = sys.stdin
+    if ids_file is None and not ids:
+        raise click.UsageError('Missing the changeset ids.')
+
+    client = osm_client.OSMClient(api_url=osm_client.OSM_API, pool_size=jobs)
+    if len(ids) == 1 and ids_file is None and not json_lines:
+        # imported here, so the help is shown without loading the dependencies
+        from osmcha.changeset import Analyse
+
+        with profiled(profile):
+            ch = Analyse(ids[0], client=client)
+            ch.full_analysis()
+        print_summary(ch)
+        if timings:
+            print_timings(ch)
+        return
+
+    from osmcha.batch import analyse_many
+
+    changesets = chain(ids, read_ids(ids_file) if ids_file is not None else [])
+    with profiled(profile):
+        analysed, failed = print_results(
+            analyse_many(changesets, workers=jobs, client=client),
+            timings=timings
+            )
+    if not analysed:
+        raise click.UsageError('Missing the changeset ids.')
+    if failed:
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument('replication_file', metavar='FILE_OR_URL')
+@click.option(
+    '--geojson', type=click.Path(exists=True, dir_okay=False),
+    help='Analyse only the changesets that intersect with the Polygon or '
+    'MultiPolygon features of the file and add their names to the results.'
+    )
+@click.option('--closed', is_flag=True, help='Skip the open changesets.')
+@jobs_option
+@timings_option
+@profile_option
+def replication(replication_file, geojson, closed, jobs, timings, profile):
+    """Analyse the changesets of a replication file.
+
+    The file is parsed while it is read and the metadata of each changeset is
+    reused, so only the content of the changesets and the user details are
+    requested to the OSM API. A JSON line is printed for each changeset as
+    soon as its analysis completes.
+    """
+    from osmcha.batch import analyse_many
+    from osmcha.changeset import ChangesetList
+
+    client = osm_client.OSMClient(api_url=osm_client.OSM_API, pool_size=jobs)
+    changesets = ChangesetList(replication_file, geojson, stream=True)
+    filters = {'is_open': False} if closed else {}
+    with profiled(profile):
+        _, failed = print_results(
+            analyse_many(
+                changesets.iter_changesets(**filters), workers=jobs, client=client
+                ),
+            regions=geojson is not None, timings=timings
+            )
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+
+# the Timings and the name of the stage that is running in the current thread
+# or asyncio task, which receive the requests and bytes recorded by the
+# clients of the OSM API
+_current_stage = ContextVar('osmcha_stage', default=None)
+
+
+class Timings(object):
+    """Wall time, number of HTTP requests and bytes received in each stage of
+    an analysis. A stage can run many times, like the user lookup, and its
+    values are added up. When stages are nested, the time of the inner stage
+    is also counted in the outer one, while the requests and bytes are
+    counted only in the inner stage.
+    """
+
+    def __init__(self, hook=None):
+        """
+        Args:
+            hook: a function called with the name of the stage and a dict
+                with the seconds, requests and bytes of each run of a stage.
+        """
+        self.hook = hook
+        self.stages = {}
+
+    def add(self, name, seconds=0, requests=0, bytes=0):
+        stage = self.stages.setdefault(
+            name, {'seconds': 0, 'requests': 0, 'bytes': 0}
+            )
+        stage['seconds'] += seconds
+        stage['requests'] += requests
+        stage['bytes'] += bytes
+
+    @contextmanager
+    def stage(self, name):
+        """Measure the code executed inside the with block as a stage."""
+        run = {'seconds': 0, 'requests': 0, 'bytes': 0}
+        token = _current_stage.set((self, run))
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            run['seconds'] = perf_counter() - start
+            _current_stage.reset(token)
+            self.add(name, **run)
+            if self.hook is not None:
+                self.hook(name, run)
+
+    @property
+    def total(self):
+        """Return the sum of the seconds of the stages that are not nested."""
+        return sum(
+            stage['seconds'] for name, stage in self.stages.items()
+            if name not in NESTED_STAGES
+            )
+
+    def as_dict(self):
+        return {name: dict(stage) for name, stage in self.stages.items()}
+
+
+# stages that run inside other ones, like the parse of a changeset while it
+# is downloaded
+NESTED_STAGES = {'parse'}
+
+
+def record_request(bytes=0):
+    """Count a request and the bytes of its response in the running stage."""
+    current = _current_stage.get()
+    if current is not None:
+        current[1]['requests'] += 1
+        current[1]['bytes'] += bytes
+
+
+def record_bytes(bytes):
+    """Count bytes received by a streamed response in the running stage."""
+    current = _current_stage.get()
+    if current is not None:
+        current[1]['bytes'] += bytes
+
+
+def record_nested_stage(name, seconds):
+    """Add the seconds of a stage that runs inside the running stage, like
+    the parse of a changeset while it is downloaded.
+    """
+    current = _current_stage.get()
+    if current is not None:
+        current[0].add(name, seconds=seconds)
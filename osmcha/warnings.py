@@ -1,20 +1,24 @@
+# -*- coding: utf-8 -*-
+DEFAULT_WARNINGS = (
+    {'tag': 'warnings:almost_junction', 'reason': 'Almost junction', 'exact_match': False},
+    {'tag': 'warnings:close_nodes', 'reason': 'Very close points', 'exact_match': False},
+    {'tag': 'warnings:crossing_ways', 'reason': 'Crossing ways', 'exact_match': False},
+    {'tag': 'warnings:disconnected_way', 'reason': 'Disconnected way', 'exact_match': False},
+    {'tag': 'warnings:impossible_oneway', 'reason': 'Impossible oneway', 'exact_match': False},
+    {'tag': 'warnings:incompatible_source', 'reason': 'suspect_word', 'exact_match': False},
+    {'tag': 'warnings:mismatched_geometry', 'reason': 'Mismatched geometry', 'exact_match': False},
+    {'tag': 'warnings:missing_role', 'reason': 'Missing role', 'exact_match': False},
+    {'tag': 'warnings:missing_tag', 'reason': 'Missing tag', 'exact_match': False},
+    {'tag': 'warnings:outdated_tags', 'reason': 'Outdated tags', 'exact_match': False},
+    {'tag': 'warnings:private_data', 'reason': 'Private information', 'exact_match': False},
+    {'tag': 'warnings:suspicious_name:generic_name', 'reason': 'Generic name', 'exact_match': True},
+    {'tag': 'warnings:unsquare_way', 'reason': 'Unsquare corners', 'exact_match': False},
+    )
+
+
 class Warnings(object):
     def __init__(self):
-        self.tags = [
-            {'tag': 'warnings:almost_junction', 'reason': 'Almost junction', 'exact_match': False},
-            {'tag': 'warnings:close_nodes', 'reason': 'Very close points', 'exact_match': False},
-            {'tag': 'warnings:crossing_ways', 'reason': 'Crossing ways', 'exact_match': False},
-            {'tag': 'warnings:disconnected_way', 'reason': 'Disconnected way', 'exact_match': False},
-            {'tag': 'warnings:impossible_oneway', 'reason': 'Impossible oneway', 'exact_match': False},
-            {'tag': 'warnings:incompatible_source', 'reason': 'suspect_word', 'exact_match': False},
-            {'tag': 'warnings:mismatched_geometry', 'reason': 'Mismatched geometry', 'exact_match': False},
-            {'tag': 'warnings:missing_role', 'reason': 'Missing role', 'exact_match': False},
-            {'tag': 'warnings:missing_tag', 'reason': 'Missing tag', 'exact_match': False},
-            {'tag': 'warnings:outdated_tags', 'reason': 'Outdated tags', 'exact_match': False},
-            {'tag': 'warnings:private_data', 'reason': 'Private information', 'exact_match': False},
-            {'tag': 'warnings:suspicious_name:generic_name', 'reason': 'Generic name', 'exact_match': True},
-            {'tag': 'warnings:unsquare_way', 'reason': 'Unsquare corners', 'exact_match': False},
-            ]
+        self.tags = [dict(warning) for warning in DEFAULT_WARNINGS]
 
     def get_exact_match_warnings(self):
         return [w for w in self.tags if w['exact_match'] is True]
@@ -29,3 +33,79 @@ class Warnings(object):
         for warning in self.get_non_exact_match_warnings():
             if tag.startswith(warning['tag']):
                 return warning['reason']
+
+
+class WarningIndex(object):
+    """Index of warning tags that finds the suspicion reason of a tag without
+    verifying each warning. The exact matches are kept in a dict and the
+    prefixes in a trie. Like in Warnings.is_enabled, the exact matches have
+    priority and, if many prefixes match a tag, the first one in the list is
+    used. The index is not modified after it is built, so it can be shared by
+    all analyses.
+    """
+
+    def __init__(self, warnings=DEFAULT_WARNINGS):
+        """
+        Args:
+            warnings: a list of dicts with the 'tag', 'reason' and
+                'exact_match' keys. If exact_match is False, the warning
+                matches all tags that start with the tag.
+        """
+        self.warnings = tuple(dict(warning) for warning in warnings)
+        self._exact = {}
+        self._prefixes = {}
+        for index, warning in enumerate(self.warnings):
+            if warning.get('exact_match', False):
+                self._exact.setdefault(warning['tag'], warning['reason'])
+            else:
+                node = self._prefixes
+                for char in warning['tag']:
+                    node = node.setdefault(char, {})
+                # the position in the list decides between repeated tags
+                node.setdefault('', (index, warning['reason']))
+
+    @classmethod
+    def from_yaml(cls, path, include_defaults=True):
+        """Create an index with the warnings of a YAML file, which must have a
+        list of warnings in the same format of DEFAULT_WARNINGS.
+
+        Args:
+            path (str): the path of the YAML file.
+            include_defaults (bool): add the DEFAULT_WARNINGS before the
+                warnings of the file.
+        """
+        import yaml
+
+        with open(path, 'r') as f:
+            warnings = yaml.safe_load(f.read()) or []
+        if include_defaults:
+            warnings = list(DEFAULT_WARNINGS) + warnings
+        return cls(warnings)
+
+    def lookup(self, tag):
+        """Return the suspicion reason of a warning tag or None if the tag is
+        not enabled.
+        """
+        reason = self._exact.get(tag)
+        if reason is not None:
+            return reason
+        # the first warning of the list wins among the prefixes of the tag
+        found = self._prefixes.get('')
+        node = self._prefixes
+        for char in tag:
+            node = node.get(char)
+            if node is None:
+                break
+            if '' in node and (found is None or node[''] < found):
+                found = node['']
+        return found[1] if found is not None else None
+
+    def resolve(self, tags):
+        """Return the suspicion reasons of a list of warning tags, in the same
+        order, skipping the tags that are not enabled.
+        """
+        lookup = self.lookup
+        return [reason for reason in map(lookup, tags) if reason is not None]
+
+
+WARNINGS = WarningIndex()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import re
+from collections import namedtuple
+from functools import lru_cache
+from os import environ
+from os.path import abspath, dirname, getmtime, join
+from threading import Event, Lock, Thread
+
+
+SUSPECT_WORDS_FILE = environ.get(
+    'SUSPECT_WORDS', join(dirname(abspath(__file__)), 'suspect_words.yaml')
+    )
+
+# the illegal sources that are ignored when the source field also has one of
+# the phrases, as the panoramas of Yandex can be used
+SOURCE_EXCEPTIONS = {
+    'yandex': ('yandex panorama',),
+    'яндекс': ('яндекс панорам', 'яндекс.панорам'),
+    }
+
+
+def trie_regex(words):
+    """Return a regular expression that matches any of the words. The words
+    are arranged in a trie, so the regex engine doesn't need to try each word
+    at each position of the text, and the longest word is preferred when a
+    word is a prefix of another one.
+
+    Args:
+        words: a list of strings. They are matched literally.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    if not trie:
+        # never matches
+        return '(?!)'
+    return _trie_pattern(trie)
+
+
+def _trie_pattern(node):
+    branches = [
+        re.escape(char) + _trie_pattern(child)
+        for char, child in sorted(node.items()) if char
+        ]
+    if not branches:
+        return ''
+    if len(branches) == 1 and '' not in node:
+        return branches[0]
+    pattern = '(?:{})'.format('|'.join(branches))
+    if '' in node:
+        pattern += '?'
+    return pattern
+
+
+class WordMatcher(object):
+    """Find the suspect words and the illegal sources in the fields of a
+    changeset. The word lists are compiled once into regular expressions, so
+    the same matcher can verify any number of changesets. As in find_words,
+    a suspect word matches the words of the text that start with it, while
+    an illegal source matches anywhere in the text.
+    """
+
+    def __init__(self, suspect_words, excluded_words=(), illegal_sources=(),
+                 source_exceptions=SOURCE_EXCEPTIONS):
+        """
+        Args:
+            suspect_words: a list of words to search in the comment.
+            excluded_words: a list of words that avoid false positives, like
+                'important' when searching by 'import'.
+            illegal_sources: a list of words to search in the source and
+                imagery_used fields.
+            source_exceptions: a dict with illegal sources that are ignored
+                in the source field when it also has one of the phrases.
+        """
+        self.suspect_words = [word.lower() for word in suspect_words]
+        self.excluded_words = [word.lower() for word in excluded_words]
+        self.illegal_sources = [word.lower() for word in illegal_sources]
+        self.source_exceptions = source_exceptions
+        word_start = r'(?:^|(?<= ))'
+        self._suspect = re.compile(word_start + trie_regex(self.suspect_words))
+        self._excluded = re.compile(word_start + trie_regex(self.excluded_words))
+        # the lookahead finds the sources that overlap with other ones
+        self._sources = re.compile(
+            '(?=({}))'.format(trie_regex(self.illegal_sources))
+            )
+
+    def find_words(self, text):
+        """Return the suspect words found in the comment, unless the number of
+        excluded words found is equal or greater.
+        """
+        text = text.lower()
+        found = self._suspect.findall(text)
+        if len(found) > len(self._excluded.findall(text)):
+            return found
+        return []
+
+    def find_sources(self, text, exceptions=True):
+        """Return the illegal sources found in the text.
+
+        Args:
+            text (str): the value of the source or imagery_used field.
+            exceptions (bool): ignore the source_exceptions.
+        """
+        text = text.lower()
+        found = []
+        for match in self._sources.findall(text):
+            # the match is the longest source at its position, but the
+            # shorter ones are there as well
+            for word in self.illegal_sources:
+                if match.startswith(word) and word not in found:
+                    found.append(word)
+        if exceptions:
+            found = [
+                word for word in found
+                if not any(
+                    phrase in text for phrase in self.source_exceptions.get(word, ())
+                    )
+                ]
+        return found
+
+    def scan(self, comment=None, source=None, imagery_used=None):
+        """Verify the comment, source and imagery_used fields of a changeset
+        and return a dict with the words found in each field. The fields
+        without suspect words are not in the dict.
+        """
+        matches = {
+            'comment': self.find_words(comment) if comment else [],
+            'source': self.find_sources(source) if source else [],
+            'imagery_used': (
+                self.find_sources(imagery_used, exceptions=False)
+                if imagery_used else []
+                ),
+            }
+        return {field: words for field, words in matches.items() if words}
+
+
+@lru_cache(maxsize=32)
+def _get_matcher(suspect_words, excluded_words, illegal_sources):
+    return WordMatcher(suspect_words, excluded_words, illegal_sources)
+
+
+def get_matcher(suspect_words, excluded_words=(), illegal_sources=()):
+    """Return a WordMatcher of the word lists. The matchers of the last used
+    lists are kept, so they are compiled only once.
+    """
+    return _get_matcher(
+        tuple(suspect_words), tuple(excluded_words), tuple(illegal_sources)
+        )
+
+
+def load_words(path=SUSPECT_WORDS_FILE):
+    """Read the word lists from a YAML file with the 'common', 'sources' and
+    'exclude' keys."""
+    import yaml
+
+    with open(path, 'r') as f:
+        return yaml.safe_load(f.read())
+
+
+Words = namedtuple(
+    'Words',
+    ['mtime', 'suspect_words', 'excluded_words', 'illegal_sources', 'matcher']
+    )
+Words.__doc__ = """A version of the word lists of a WordList and the
+WordMatcher compiled from them."""
+
+
+class WordList(object):
+    """Word lists loaded from a YAML file that can be reloaded when the file is
+    modified, without restarting the process. The new lists are loaded and
+    compiled before replacing the current version at once, so the analyses
+    that already took a version are not affected.
+    """
+
+    def __init__(self, path=SUSPECT_WORDS_FILE):
+        """
+        Args:
+            path (str): the path of the YAML file.
+        """
+        self.path = path
+        self._lock = Lock()
+        self._stop = Event()
+        self._watcher = None
+        self._current = self._load()
+
+    def _load(self):
+        mtime = getmtime(self.path)
+        words = load_words(self.path)
+        suspect_words = words['common'] + words['sources']
+        return Words(
+            mtime, suspect_words, words['exclude'], words['sources'],
+            get_matcher(suspect_words, words['exclude'], words['sources'])
+            )
+
+    def snapshot(self):
+        """Return the current Words. Use the same snapshot to read all the
+        lists, so they belong to the same version of the file.
+        """
+        return self._current
+
+    def reload(self):
+        """Load the file again if it was modified since the last load and
+        return True if the lists were replaced. If the file can't be read, the
+        current lists are kept.
+        """
+        with self._lock:
+            try:
+                if getmtime(self.path) == self._current.mtime:
+                    return False
+                self._current = self._load()
+            except Exception as e:
+                print('Could not reload the word lists of {}: {}'.format(self.path, e))
+                return False
+            return True
+
+    def watch(self, interval=60):
+        """Verify the modification time of the file every interval seconds
+        in a daemon thread and reload it when it changes.
+        """
+        if self._watcher is None:
+            self._stop.clear()
+            self._watcher = Thread(
+                target=self._watch, args=(interval,), daemon=True,
+                name='osmcha-word-list'
+                )
+            self._watcher.start()
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.reload()
+
+    def stop(self):
+        """Stop watching the file."""
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+
+
+_default_word_list = None
+_default_word_list_lock = Lock()
+
+
+def get_word_list():
+    """Return the WordList used by default in Analyse. It is loaded from the
+    SUSPECT_WORDS_FILE on the first call and watched for modifications.
+    """
+    global _default_word_list
+    with _default_word_list_lock:
+        if _default_word_list is None:
+            _default_word_list = WordList()
+            _default_word_list.watch()
+        return _default_word_list
+
+
+def set_word_list(word_list):
+    """Replace the WordList used by default in Analyse."""
+    global _default_word_list
+    with _default_word_list_lock:
+        _default_word_list = word_list
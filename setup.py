@@ -30,13 +30,15 @@ setup(name='osmcha',
       zip_safe=False,
       install_requires=[
           'click',
+          'numpy',
           'requests',
-          'shapely',
+          'shapely>=2.0',
           'python-dateutil',
           'PyYAML'
       ],
       extras_require={
-          'test': ['pytest'],
+          'test': ['pytest', 'aiohttp'],
+          'async': ['aiohttp'],
       },
       entry_points="""
       [console_scripts]
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+from functools import partial
+from http.server import (
+    BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+    )
+from os.path import abspath, dirname, isfile, join
+from threading import Thread
+from urllib.parse import parse_qs, urlsplit
+import xml.etree.ElementTree as ET
+
+import pytest
+
+
+TESTS_DIR = dirname(abspath(__file__))
+API_DIR = join(TESTS_DIR, 'api')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class OSMAPIHandler(BaseHTTPRequestHandler):
+    """Replay the responses of the OSM API recorded in the tests/api folder.
+    The path /api/0.6/changeset/1/download is served from
+    tests/api/changeset/1/download.xml. The multi-changeset and multi-user
+    queries are composed from the recorded data of each changeset or user.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.requests.append(self.path)
+        self.server.connections.add(self.client_address)
+        if url.path == '/api/0.6/changesets':
+            ids = parse_qs(url.query)['changesets'][0].split(',')
+            self.send_content(200, self.compose('changeset', ids))
+            return
+        if url.path == '/api/0.6/users':
+            ids = parse_qs(url.query)['users'][0].split(',')
+            self.send_content(200, self.compose('user', ids))
+            return
+        content = read_recorded(url.path.replace('/api/0.6/', '', 1))
+        if url.path.startswith('/api/0.6/') and content is not None:
+            self.send_content(200, content)
+        else:
+            self.send_content(404, b'Not found')
+
+    def compose(self, kind, ids):
+        """Return an osm document with the recorded elements of many ids."""
+        root = ET.Element('osm', version='0.6', generator='OpenStreetMap server')
+        for id in ids:
+            content = read_recorded('{}/{}'.format(kind, id))
+            if content is not None:
+                root.extend(ET.fromstring(content))
+        return ET.tostring(root, encoding='UTF-8')
+
+    def send_content(self, status, content):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def read_recorded(path):
+    filename = join(API_DIR, path + '.xml')
+    if isfile(filename):
+        with open(filename, 'rb') as f:
+            return f.read()
+
+
+def start_server(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    server.requests = []
+    server.connections = set()
+    server.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    server.api_url = '{}/api/0.6'.format(server.url)
+    Thread(
+        target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        ).start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def file_server():
+    """Serve the files of the tests folder in a local HTTP server and return
+    its base URL.
+    """
+    server = start_server(partial(QuietHandler, directory=TESTS_DIR))
+    yield server.url
+    stop_server(server)
+
+
+@pytest.fixture
+def osm_api():
+    """Start a local stand-in of the OSM API. The requested paths and the
+    client addresses are registered in server.requests and server.connections.
+    """
+    server = start_server(OSMAPIHandler)
+    yield server
+    stop_server(server)
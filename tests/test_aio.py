@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from osmcha import aio  # noqa: E402
+from osmcha.cache import DiskCache  # noqa: E402
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_async_api_functions(osm_api):
+    async def main():
+        async with aio.AsyncOSMClient(api_url=osm_api.api_url) as client:
+            metadata = await aio.get_metadata(1, client)
+            xml = await aio.get_changeset(1, client)
+            reasons = await aio.get_user_details('456', client)
+            return metadata, xml, reasons
+
+    metadata, xml, reasons = run(main())
+    assert metadata.get('id') == '1'
+    assert len(xml) == 13
+    assert reasons == ['New mapper', 'User has multiple blocks']
+    assert len(osm_api.connections) == 1
+
+
+def test_async_analyse(osm_api, monkeypatch):
+    def get_default_client():
+        raise AssertionError('the default client was created')
+
+    # the analyses don't create the synchronous client
+    monkeypatch.setattr('osmcha.changeset.get_default_client', get_default_client)
+
+    async def main():
+        async with aio.AsyncOSMClient(api_url=osm_api.api_url) as client:
+            results = await asyncio.gather(
+                aio.analyse(1, client),
+                aio.analyse(2, client),
+                aio.analyse(2, client, create_threshold=1000),
+                aio.analyse('3', client),
+                )
+            return results, client.user_cache.stats()
+
+    (first, second, custom, third), stats = run(main())
+    assert (first.create, first.modify, first.delete) == (8, 3, 2)
+    assert first.is_suspect is False
+    assert set(second.suspicion_reasons) == {
+        'possible import', 'suspect_word', 'New mapper', 'User has multiple blocks'
+        }
+    assert 'possible import' not in custom.suspicion_reasons
+    assert third.modify == 3
+    # concurrent requests of the same user are coalesced
+    assert osm_api.requests.count('/api/0.6/user/456') == 1
+    assert osm_api.requests.count('/api/0.6/user/123123') == 1
+    # each lookup is a single hit, miss or coalesced call
+    assert stats['misses'] == 2
+    assert stats['hits'] + stats['coalesced'] == 2
+
+
+def test_async_skip_small_changesets(osm_api):
+    async def main():
+        async with aio.AsyncOSMClient(api_url=osm_api.api_url) as client:
+            return await aio.analyse(1, client, skip_small_changesets=True)
+
+    ch = run(main())
+    assert ch.counts_fetched is False
+    assert ch.create is None
+    assert '/api/0.6/changeset/1/download' not in osm_api.requests
+
+
+def test_async_user_details_errors(osm_api):
+    async def main():
+        async with aio.AsyncOSMClient(api_url=osm_api.api_url) as client:
+            missing = await aio.get_user_details('999', client)
+        async with aio.AsyncOSMClient(api_url='http://127.0.0.1:1/api/0.6') as client:
+            unreachable = await aio.get_user_details('456', client)
+        return missing, unreachable
+
+    assert run(main()) == ([], [])
+
+
+def test_async_changeset_cache(osm_api, tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    async def main():
+        async with aio.AsyncOSMClient(api_url=osm_api.api_url, changeset_cache=cache) as client:
+            await aio.analyse(1, client)
+            await aio.analyse(1, client)
+
+    run(main())
+    assert sorted(osm_api.requests) == [
+        '/api/0.6/changeset/1', '/api/0.6/changeset/1/download', '/api/0.6/user/123123'
+        ]
+
+
+def test_async_timings(osm_api):
+    async def main():
+        async with aio.AsyncOSMClient(api_url=osm_api.api_url) as client:
+            return await aio.analyse(2, client)
+
+    stages = run(main()).timings.as_dict()
+    assert set(stages) == {
+        'metadata', 'download', 'parse', 'words', 'user', 'warnings'
+        }
+    assert stages['metadata']['requests'] == 1
+    assert stages['download']['requests'] == 1
+    assert stages['download']['bytes'] > 0
+    assert stages['user']['requests'] == 1
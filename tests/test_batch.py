@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from osmcha.batch import analyse_many
+from osmcha.changeset import changeset_info, get_metadata
+from osmcha.client import OSMClient
+
+
+def test_analyse_many(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    changesets = [1, 2, changeset_info(get_metadata(3, client)), 999]
+    results = {}
+    for result in analyse_many(iter(changesets), workers=2, client=client):
+        if isinstance(result.changeset, int):
+            results[result.changeset] = result
+        else:
+            results[int(result.changeset['id'])] = result
+    assert sorted(results) == [1, 2, 3, 999]
+    assert results[1].error is None
+    assert results[1].analyse.is_suspect is False
+    assert (results[1].analyse.create, results[1].analyse.modify) == (8, 3)
+    assert 'possible import' in results[2].analyse.suspicion_reasons
+    assert results[3].analyse.id == 3
+    assert results[3].analyse.modify == 3
+    assert results[999].analyse is None
+    assert results[999].error is not None
+    # the metadata of the ids was requested at once and the metadata of the
+    # changeset 3 was not requested again
+    assert '/api/0.6/changesets?changesets=1%2C2%2C999' in osm_api.requests
+    assert osm_api.requests.count('/api/0.6/changeset/3') == 1
+    assert '/api/0.6/changeset/1' not in osm_api.requests
+    # the changeset 999 was not found, so it was requested individually
+    assert '/api/0.6/changeset/999' in osm_api.requests
+    # the user details were requested at once
+    assert '/api/0.6/users?users=123123%2C456' in osm_api.requests
+    assert not [path for path in osm_api.requests if '/user/' in path]
+
+
+def test_analyse_many_custom_thresholds(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    results = list(analyse_many([2], client=client, create_threshold=1000))
+    assert 'possible import' not in results[0].analyse.suspicion_reasons
+    assert results[0].analyse.create_threshold == 1000
+
+
+def test_analyse_many_metadata_chunks(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    results = list(analyse_many(['1', '2', '3'], workers=1, client=client, chunk_size=2))
+    assert sorted(result.changeset for result in results) == ['1', '2', '3']
+    assert [path for path in osm_api.requests if '/changesets?' in path] == [
+        '/api/0.6/changesets?changesets=1%2C2', '/api/0.6/changesets?changesets=3'
+        ]
+    # only the changeset contents were requested individually
+    assert '/api/0.6/changeset/1' not in osm_api.requests
+    assert '/api/0.6/changeset/3' not in osm_api.requests
+
+
+def test_analyse_many_without_bulk_metadata(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    results = list(analyse_many(
+        [1], client=client, bulk_metadata=False, bulk_users=False
+        ))
+    assert results[0].analyse.id == 1
+    assert sorted(osm_api.requests) == [
+        '/api/0.6/changeset/1', '/api/0.6/changeset/1/download',
+        '/api/0.6/user/123123'
+        ]
+
+
+def test_analyse_many_user_chunks(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    results = list(analyse_many(
+        [1, 2, 3], workers=1, client=client, chunk_size=2
+        ))
+    reasons = {r.changeset: r.analyse.suspicion_reasons for r in results}
+    assert 'New mapper' in reasons[2]
+    assert 'User has multiple blocks' in reasons[2]
+    assert 'New mapper' not in reasons[3]
+    # the user of the changeset 3 was already in the cache
+    assert [path for path in osm_api.requests if '/users?' in path] == [
+        '/api/0.6/users?users=123123%2C456'
+        ]
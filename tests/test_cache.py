@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from os import listdir, urandom, utime
+from os.path import join
+from threading import Event
+from time import sleep
+
+from pytest import raises
+
+from osmcha.cache import DiskCache, TTLCache
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'coalesced': 0, 'size': 2}
+
+
+def test_ttl_cache_expiration():
+    timer = FakeTimer()
+    cache = TTLCache(ttl=10, timer=timer)
+    cache.set('a', 1)
+    timer.now = 9
+    assert 'a' in cache
+    assert cache.get('a') == 1
+    timer.now = 10
+    assert 'a' not in cache
+    assert cache.get('a') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert len(cache) == 0
+
+
+def test_ttl_cache_get_or_compute():
+    cache = TTLCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'value'
+
+    assert cache.get_or_compute('a', compute) == 'value'
+    assert cache.get_or_compute('a', compute) == 'value'
+    assert len(calls) == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    # None values and exceptions are not cached
+    assert cache.get_or_compute('b', lambda: None) is None
+    assert 'b' not in cache._data
+    with raises(ValueError):
+        cache.get_or_compute('c', lambda: int('x'))
+    assert cache.get_or_compute('c', lambda: 3) == 3
+
+
+def test_ttl_cache_single_flight():
+    cache = TTLCache()
+    started = Event()
+    release = Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        first = executor.submit(cache.get_or_compute, 'a', compute)
+        started.wait(5)
+        others = [executor.submit(cache.get_or_compute, 'a', compute) for i in range(4)]
+        while cache.coalesced < 4:
+            sleep(0.001)
+        release.set()
+        assert first.result() == 'value'
+        assert [f.result() for f in others] == ['value'] * 4
+    assert len(calls) == 1
+    assert cache.misses == 1
+    assert cache.coalesced == 4
+
+
+def test_ttl_cache_async_single_flight():
+    cache = TTLCache()
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        if value == 'error':
+            raise ValueError(value)
+        return value
+
+    async def main():
+        results = await asyncio.gather(*[
+            cache.get_or_compute_async('a', lambda: compute('a')) for _ in range(5)
+            ])
+        cached = await cache.get_or_compute_async('a', lambda: compute('b'))
+        with raises(ValueError):
+            await cache.get_or_compute_async('e', lambda: compute('error'))
+        return results, cached
+
+    results, cached = asyncio.run(main())
+    assert results == ['a'] * 5
+    assert cached == 'a'
+    assert calls == ['a', 'error']
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'coalesced': 4, 'size': 1}
+    assert cache._async_in_flight == {}
+
+
+def test_ttl_cache_maxsize_zero():
+    cache = TTLCache(maxsize=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+
+
+def test_disk_cache(tmp_path):
+    cache = DiskCache(str(tmp_path / 'cache'))
+    assert cache.get('a') is None
+    assert 'a' not in cache
+    cache.set('a', b'<osm/>')
+    assert 'a' in cache
+    assert cache.get('a') == b'<osm/>'
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+    # the content persists and the size is computed on the initialization
+    other = DiskCache(str(tmp_path / 'cache'))
+    assert other.get('a') == b'<osm/>'
+    assert other.size() == cache.size() > 0
+
+
+def test_disk_cache_concurrent_set(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    contents = [urandom(100000) for _ in range(4)]
+    for _ in range(20):
+        with ThreadPoolExecutor(4) as executor:
+            list(executor.map(
+                lambda content: cache.set('changeset-1-download', content), contents
+                ))
+        assert cache.get('changeset-1-download') in contents
+    assert listdir(str(tmp_path)) == ['changeset-1-download.gz']
+    assert cache.size() == DiskCache(str(tmp_path)).size()
+
+
+def test_disk_cache_eviction(tmp_path):
+    content = urandom(1000)
+    cache = DiskCache(str(tmp_path), max_size=3500)
+    for key in ['a', 'b', 'c']:
+        cache.set(key, content)
+    utime(join(str(tmp_path), 'a.gz'), (1, 1))
+    utime(join(str(tmp_path), 'b.gz'), (2, 2))
+    utime(join(str(tmp_path), 'c.gz'), (3, 3))
+    # reading an item marks it as recently used
+    assert cache.get('a') == content
+    cache.set('d', content)
+    assert 'b' not in cache
+    assert all(key in cache for key in ['a', 'c', 'd'])
+    assert cache.size() <= 3500
+
+
+def test_disk_cache_low_water(tmp_path, monkeypatch):
+    content = urandom(1000)
+    cache = DiskCache(str(tmp_path), max_size=5000, low_water=0.5)
+    for i, key in enumerate(['a', 'b', 'c', 'd', 'e']):
+        cache.set(key, content)
+        utime(join(str(tmp_path), key + '.gz'), (i, i))
+    # the folder is reduced to half of max_size at once
+    assert [key in cache for key in 'abcde'] == [False, False, False, True, True]
+    assert cache.size() <= 2500
+
+    evictions = []
+    monkeypatch.setattr(cache, '_evict', lambda: evictions.append(1))
+    cache.set('f', content)
+    cache.set('g', content)
+    assert evictions == []
+
+
+def test_disk_cache_stale_files(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.set('a', b'<osm/>')
+    for name in ['b.gz.1.tmp', 'c.gz.2.tmp']:
+        with open(join(str(tmp_path), name), 'wb') as f:
+            f.write(b'partial')
+    # an old temporary file was left by an interrupted write, while the recent
+    # one can be being written by another process
+    utime(join(str(tmp_path), 'b.gz.1.tmp'), (1, 1))
+    cache = DiskCache(str(tmp_path))
+    assert sorted(listdir(str(tmp_path))) == ['a.gz', 'c.gz.2.tmp']
+    assert cache.get('a') == b'<osm/>'
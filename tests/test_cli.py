@@ -1,4 +1,11 @@
 # -*- coding: utf-8 -*-
+import gzip
+import json
+import pstats
+import subprocess
+import sys
+import xml.etree.ElementTree as ET
+
 from click.testing import CliRunner
 
 from osmcha.scripts.cli import cli
@@ -16,3 +23,167 @@ def test_cli():
     assert "Created: 47. Modified: 0. Deleted: 0" in result.output
     assert "The changeset 45632780 is suspect!" in result.output
     assert "Reasons: suspect_word" in result.output
+
+
+def test_cli_help():
+    runner = CliRunner()
+    result = runner.invoke(cli, ['--help'])
+    assert result.exit_code == 0
+    assert 'Analyse OpenStreetMap changesets.' in result.output
+
+
+def import_times(module):
+    """Import a module in a new interpreter and return a dict with the
+    cumulative import time in microseconds of each imported module.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True
+        )
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_cli_import_time():
+    # the import time depends on the machine, so only verify that the slow
+    # dependencies are loaded when they are used
+    heavy = {'numpy', 'shapely', 'requests', 'yaml', 'osmcha.changeset'}
+    times = import_times('osmcha.scripts.cli')
+    assert 'osmcha.scripts.cli' in times
+    assert heavy.isdisjoint(times)
+
+    times = import_times('osmcha.changeset')
+    assert set(times) & heavy == {'osmcha.changeset'}
+
+
+def test_cli_single_id(osm_api, monkeypatch):
+    monkeypatch.setattr('osmcha.client.OSM_API', osm_api.api_url)
+    result = CliRunner().invoke(cli, ['2'])
+    assert result.exit_code == 0
+    assert 'Created: 300. Modified: 20. Deleted: 10' in result.output
+    assert 'The changeset 2 is suspect! Reasons: ' in result.output
+
+    result = CliRunner().invoke(cli, ['--json', '2'])
+    assert result.exit_code == 0
+    line = json.loads(result.output)
+    assert line['id'] == 2
+    assert line['create'] == 300
+    assert line['date'] == '2015-04-26T10:00:00'
+
+
+def test_cli_many_ids(osm_api, monkeypatch):
+    monkeypatch.setattr('osmcha.client.OSM_API', osm_api.api_url)
+    result = CliRunner().invoke(cli, ['1', '2', '3', '-j', '2'])
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert sorted(line['id'] for line in lines) == [1, 2, 3]
+    for line in lines:
+        if line['id'] == 2:
+            assert 'possible import' in line['suspicion_reasons']
+            assert line['element_counts']['create']['way'] == 60
+
+
+def test_cli_ids_file(osm_api, monkeypatch, tmp_path):
+    monkeypatch.setattr('osmcha.client.OSM_API', osm_api.api_url)
+    ids_file = tmp_path / 'ids.txt'
+    ids_file.write_text('1\n\n3\nthree\n999\n')
+    runner = CliRunner()
+    result = runner.invoke(cli, ['2', '--file', str(ids_file)])
+    assert result.exit_code == 1
+    assert 'Invalid changeset id in line 4: three' in result.stderr
+    lines = {
+        line['id']: line for line in map(json.loads, result.stdout.splitlines())
+        }
+    assert sorted(lines) == [1, 2, 3, 999]
+    assert 'error' in lines[999]
+    assert lines[3]['modify'] == 3
+
+    # the ids piped to stdin
+    result = runner.invoke(cli, [], input='1\n3\n')
+    assert result.exit_code == 0
+    assert sorted(json.loads(line)['id'] for line in result.stdout.splitlines()) == [1, 3]
+
+    result = runner.invoke(cli, ['-f', '-'], input='2\n')
+    assert json.loads(result.stdout)['id'] == 2
+
+
+def test_cli_without_ids():
+    result = CliRunner().invoke(cli, [])
+    assert result.exit_code == 2
+    assert 'Missing the changeset ids.' in result.output
+
+
+def write_replication_file(path):
+    """Write a replication file with the changesets recorded in tests/api and
+    one changeset outside the regions of tests/regions.geojson.
+    """
+    root = ET.Element('osm', version='0.6')
+    for id in [1, 2, 3]:
+        root.extend(ET.parse(f'tests/api/changeset/{id}.xml').getroot())
+    ET.SubElement(
+        root, 'changeset', id='4', created_at='2015-04-25T18:08:46Z',
+        open='false', num_changes='1', user='Far', uid='4', min_lat='10',
+        min_lon='10', max_lat='10.1', max_lon='10.1', comments_count='0'
+        )
+    with gzip.open(path, 'wb') as f:
+        f.write(ET.tostring(root, encoding='UTF-8'))
+
+
+def test_cli_replication(osm_api, monkeypatch, tmp_path):
+    monkeypatch.setattr('osmcha.client.OSM_API', osm_api.api_url)
+    path = str(tmp_path / '001.osm.gz')
+    write_replication_file(path)
+    result = CliRunner().invoke(cli, [
+        'replication', path, '--geojson', 'tests/regions.geojson', '-j', '2'
+        ])
+    assert result.exit_code == 0
+    lines = {line['id']: line for line in map(json.loads, result.output.splitlines())}
+    assert sorted(lines) == [1, 2, 3]
+    assert lines[1]['regions'] == ['White Mountains', 'New England']
+    assert 'possible import' in lines[2]['suspicion_reasons']
+    # the metadata of the file was used
+    assert not [
+        path for path in osm_api.requests
+        if path.startswith('/api/0.6/changeset/') and not path.endswith('/download')
+        ]
+    assert not [path for path in osm_api.requests if '/changesets?' in path]
+
+    result = CliRunner().invoke(cli, ['replication', path, '--closed'])
+    assert result.exit_code == 1
+    lines = {line['id']: line for line in map(json.loads, result.output.splitlines())}
+    assert sorted(lines) == [1, 2, 4]
+    assert 'regions' not in lines[1]
+    # the changeset 4 is not in the OSM API
+    assert 'error' in lines[4]
+
+
+def test_cli_commands():
+    result = CliRunner().invoke(cli, ['--help'])
+    assert 'analyse' in result.output
+    assert 'replication' in result.output
+    result = CliRunner().invoke(cli, ['replication', '--help'])
+    assert 'Analyse the changesets of a replication file.' in result.output
+
+
+def test_cli_timings_and_profile(osm_api, monkeypatch, tmp_path):
+    monkeypatch.setattr('osmcha.client.OSM_API', osm_api.api_url)
+    result = CliRunner().invoke(cli, ['2', '--timings'])
+    assert result.exit_code == 0
+    assert 'Timings (total: ' in result.output
+    assert '  download: ' in result.output
+
+    profile = str(tmp_path / 'osmcha.prof')
+    result = CliRunner().invoke(
+        cli, ['1', '2', '--timings', '--profile', profile]
+        )
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert all(line['timings']['download']['requests'] == 1 for line in lines)
+    stats = pstats.Stats(profile)
+    # the analyses ran in the threads of analyse_many
+    assert [f for f in stats.stats if f[2] == 'get_changeset_counts']
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import xml.etree.ElementTree as ET
+
+from osmcha.changeset import (
+    Analyse, ChangeCounter, changeset_info, count_changes, get_changeset,
+    get_changeset_counts, get_metadata, get_metadata_many, get_user_details,
+    get_users_details
+    )
+from osmcha.cache import DiskCache
+from osmcha.client import OSMClient, get_default_client, set_default_client
+
+
+def test_client_reuses_connections(osm_api):
+    client = OSMClient(api_url=osm_api.api_url, pool_size=2, timeout=5)
+    assert get_metadata(1, client).get('id') == '1'
+    assert len(get_changeset(1, client)) == 13
+    assert get_user_details('456', client) == ['New mapper', 'User has multiple blocks']
+    assert osm_api.requests == [
+        '/api/0.6/changeset/1', '/api/0.6/changeset/1/download', '/api/0.6/user/456'
+        ]
+    assert len(osm_api.connections) == 1
+
+
+def test_user_details_cache(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    assert get_user_details('123123', client) == []
+    assert get_user_details(456, client) == ['New mapper', 'User has multiple blocks']
+    assert get_user_details('456', client) == ['New mapper', 'User has multiple blocks']
+    assert get_user_details('999', client) == []
+    assert get_user_details('999', client) == []
+    assert osm_api.requests == [
+        '/api/0.6/user/123123', '/api/0.6/user/456', '/api/0.6/user/999',
+        '/api/0.6/user/999'
+        ]
+    assert client.user_cache.hits == 1
+    assert client.user_cache.misses == 4
+
+
+def test_changeset_cache(osm_api, tmp_path):
+    cache = DiskCache(str(tmp_path))
+    client = OSMClient(api_url=osm_api.api_url, changeset_cache=cache)
+    ch = Analyse(1, client=client)
+    ch.full_analysis()
+    assert len(osm_api.requests) == 3
+
+    # the closed changeset is read from the disk cache
+    client = OSMClient(api_url=osm_api.api_url, changeset_cache=cache)
+    cached = Analyse(1, client=client)
+    cached.full_analysis()
+    assert osm_api.requests[3:] == ['/api/0.6/user/123123']
+    assert cached.get_dict() == ch.get_dict()
+
+    # open changesets are not cached
+    Analyse(3, client=client).full_analysis()
+    Analyse(3, client=client).full_analysis()
+    assert osm_api.requests[4:] == [
+        '/api/0.6/changeset/3', '/api/0.6/changeset/3/download',
+        '/api/0.6/changeset/3', '/api/0.6/changeset/3/download',
+        ]
+    assert 'changeset-3' not in cache
+    assert 'changeset-3-download' not in cache
+
+
+def test_changeset_cache_from_records(osm_api, tmp_path):
+    # the records of replication files know if the changesets are closed, so
+    # their content is cached without caching the metadata first
+    cache = DiskCache(str(tmp_path))
+    client = OSMClient(api_url=osm_api.api_url, changeset_cache=cache)
+    records = {}
+    for id in (1, 3):
+        with open('tests/api/changeset/{}.xml'.format(id), 'rb') as f:
+            records[id] = changeset_info(ET.fromstring(f.read())[0])
+    assert records[1].is_open is False
+    assert records[3].is_open is True
+    for _ in range(2):
+        Analyse(records[1], client=client).full_analysis()
+        Analyse(records[3], client=client).full_analysis()
+    assert [path for path in osm_api.requests if 'download' in path] == [
+        '/api/0.6/changeset/1/download', '/api/0.6/changeset/3/download',
+        '/api/0.6/changeset/3/download',
+        ]
+    assert 'changeset-1-download' in cache
+    assert 'changeset-1' not in cache
+    assert 'changeset-3-download' not in cache
+
+
+def test_client_headers(osm_api):
+    client = OSMClient(api_url=osm_api.api_url + '/', headers={'X-Test': 'yes'})
+    assert client.api_url == osm_api.api_url
+    assert client.session.headers['X-Test'] == 'yes'
+    assert client.session.headers['User-Agent'].startswith('OSMCha osmcha')
+
+
+def test_analyse_with_client(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    ch = Analyse(2, client=client)
+    ch.full_analysis()
+    assert ch.create == 300
+    assert ch.modify == 20
+    assert ch.delete == 10
+    assert set(ch.suspicion_reasons) == {
+        'possible import', 'suspect_word', 'New mapper', 'User has multiple blocks'
+        }
+    assert 'client' not in ch.get_dict()
+    assert len(osm_api.connections) == 1
+
+
+def test_default_client(osm_api):
+    default = get_default_client()
+    try:
+        set_default_client(OSMClient(api_url=osm_api.api_url))
+        ch = Analyse(1)
+        ch.full_analysis()
+        assert (ch.create, ch.modify, ch.delete) == (8, 3, 2)
+        assert ch.is_suspect is False
+    finally:
+        set_default_client(default)
+
+
+def test_get_metadata_many(osm_api, tmp_path):
+    cache = DiskCache(str(tmp_path))
+    client = OSMClient(api_url=osm_api.api_url, changeset_cache=cache)
+    changesets = list(get_metadata_many([1, 2, 3, 999], client, chunk_size=3))
+    assert [ch['id'] for ch in changesets] == ['1', '2', '3']
+    assert changesets[1]['created_by'].startswith('JOSM')
+    assert osm_api.requests == [
+        '/api/0.6/changesets?changesets=1%2C2%2C3',
+        '/api/0.6/changesets?changesets=999',
+        ]
+    # the closed changesets are cached and have the same content as the
+    # metadata of a single changeset
+    assert 'changeset-1' in cache and 'changeset-2' in cache
+    assert 'changeset-3' not in cache
+    assert get_metadata(2, client).get('comments_count') == '0'
+    assert len(osm_api.requests) == 2
+    cached = list(get_metadata_many([1, 2, 3], client))
+    assert osm_api.requests[2:] == ['/api/0.6/changesets?changesets=3']
+    assert [dict(ch) for ch in cached] == [dict(ch) for ch in changesets]
+
+
+def test_get_users_details(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    assert get_user_details('456', client) == ['New mapper', 'User has multiple blocks']
+    details = get_users_details([123123, '456', 999, '123123'], client, chunk_size=1)
+    assert details == {
+        '123123': [], '456': ['New mapper', 'User has multiple blocks']
+        }
+    # only the users that were not in the cache were requested
+    assert osm_api.requests[1:] == [
+        '/api/0.6/users?users=123123', '/api/0.6/users?users=999'
+        ]
+    assert get_user_details(123123, client) == []
+    assert len(osm_api.requests) == 3
+
+
+def test_skip_small_changesets(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    ch = Analyse(1, client=client, skip_small_changesets=True)
+    assert ch.changes_count == 13
+    assert ch.count_is_decided() is True
+    ch.full_analysis()
+    assert (ch.create, ch.modify, ch.delete) == (None, None, None)
+    assert ch.counts_fetched is False
+    assert ch.is_suspect is False
+    assert '/api/0.6/changeset/1/download' not in osm_api.requests
+    assert 'changes_count' not in ch.get_dict()
+    assert 'counts_fetched' not in ch.get_dict()
+
+    # the changes_count of the changeset 2 is greater than the thresholds
+    ch = Analyse(2, client=client, skip_small_changesets=True)
+    ch.full_analysis()
+    assert ch.counts_fetched is True
+    assert ch.create == 300
+    assert 'possible import' in ch.suspicion_reasons
+    assert '/api/0.6/changeset/2/download' in osm_api.requests
+
+    # a changeset with a high threshold is downloaded
+    ch = Analyse(1, client=client, skip_small_changesets=True, delete_threshold=5)
+    assert ch.count_is_decided() is False
+    ch = Analyse(1, client=client)
+    ch.full_analysis()
+    assert ch.counts_fetched is True
+    assert (ch.create, ch.modify, ch.delete) == (8, 3, 2)
+
+
+def test_change_counter(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    expected = {
+        'create': {'node': 6, 'way': 2, 'relation': 0},
+        'modify': {'node': 2, 'way': 1, 'relation': 0},
+        'delete': {'node': 1, 'way': 0, 'relation': 1},
+        }
+    assert get_changeset_counts(1, client, chunk_size=100) == expected
+    assert count_changes(get_changeset(1, client)) == expected
+
+    # the document can be split anywhere and the parsed elements are cleared
+    with open('tests/api/changeset/1/download.xml', 'rb') as f:
+        content = f.read()
+    counter = ChangeCounter()
+    for i in range(0, len(content), 7):
+        counter.feed(content[i:i + 7])
+        assert len(counter._root or []) <= 1
+    assert counter.close() == expected
+
+    ch = Analyse(1, client=client)
+    ch.full_analysis()
+    assert ch.element_counts == expected
+    assert ch.get_dict()['element_counts'] == expected
+    assert (ch.create, ch.modify, ch.delete) == (8, 3, 2)
+
+
+def test_change_counter_single_action():
+    # an import can have a single action with all the elements
+    counter = ChangeCounter()
+    counter.feed(b'<osmChange version="0.6"><create>')
+    action = counter._action_element
+    node = b'<node id="-%d" lat="1" lon="1" changeset="1"><tag k="a" v="b"/></node>'
+    for i in range(1, 10001):
+        counter.feed(node % i)
+        assert len(action) <= 1
+    counter.feed(b'<way id="-1" changeset="1"><nd ref="-1"/></way>')
+    assert len(action) <= 1
+    counter.feed(b'</create></osmChange>')
+    assert len(action) == 0
+    assert counter.close() == {
+        'create': {'node': 10000, 'way': 1, 'relation': 0},
+        'modify': {'node': 0, 'way': 0, 'relation': 0},
+        'delete': {'node': 0, 'way': 0, 'relation': 0},
+        }
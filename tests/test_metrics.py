@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+from urllib.request import urlopen
+
+import pytest
+
+from osmcha.cache import TTLCache
+from osmcha.changeset import Analyse, ChangesetList
+from osmcha.client import OSMClient
+from osmcha.metrics import (
+    ANALYSES, CACHE_REQUESTS, CHANGESETS_PARSED, HTTP_REQUESTS,
+    HTTP_REQUEST_SECONDS, REGISTRY, SUSPICION_REASONS, MetricsRegistry,
+    api_endpoint, start_http_server
+    )
+
+
+def test_render():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests.', ['endpoint'])
+    seconds = registry.histogram('seconds', 'Durations.', buckets=[0.1, 1])
+    requests.inc(endpoint='/a')
+    requests.inc(2, endpoint='/a')
+    requests.inc(endpoint='say "hi"\n')
+    seconds.observe(0.1)
+    seconds.observe(0.5)
+    seconds.observe(3)
+    assert requests.value(endpoint='/a') == 3
+    assert seconds.count() == 3
+    assert seconds.sum() == 3.6
+    assert registry.render() == '\n'.join([
+        '# HELP requests_total Requests.',
+        '# TYPE requests_total counter',
+        'requests_total{endpoint="/a"} 3',
+        'requests_total{endpoint="say \\"hi\\"\\n"} 1',
+        '# HELP seconds Durations.',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="0.1"} 1',
+        'seconds_bucket{le="1"} 2',
+        'seconds_bucket{le="+Inf"} 3',
+        'seconds_sum 3.6',
+        'seconds_count 3',
+        ]) + '\n'
+
+    with pytest.raises(ValueError):
+        requests.inc()
+    with pytest.raises(ValueError):
+        registry.counter('requests_total', 'Requests.')
+
+    registry.clear()
+    assert requests.value(endpoint='/a') == 0
+    assert 'requests_total{' not in registry.render()
+
+
+def test_api_endpoint():
+    assert api_endpoint('/changeset/123') == '/changeset/{id}'
+    assert api_endpoint('/changeset/123/download') == '/changeset/{id}/download'
+    assert api_endpoint('/user/42') == '/user/{id}'
+    assert api_endpoint('/changesets?changesets=1,2') == '/changesets'
+    assert api_endpoint('/users') == '/users'
+
+
+def test_cache_metrics():
+    cache = TTLCache(name='test')
+    cache.get('a')
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get_or_compute('a', lambda: 2)
+    cache.get_or_compute('b', lambda: 2)
+    assert CACHE_REQUESTS.value(cache='test', result='hit') == 2
+    assert CACHE_REQUESTS.value(cache='test', result='miss') == 2
+
+
+def test_analyse_metrics(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    metadata = HTTP_REQUESTS.value(endpoint='/changeset/{id}', status='200')
+    download = HTTP_REQUEST_SECONDS.count(endpoint='/changeset/{id}/download')
+    analyses = ANALYSES.value(suspect='true') + ANALYSES.value(suspect='false')
+    users = CACHE_REQUESTS.value(cache='users', result='miss')
+
+    ch = Analyse(2, client=client)
+    ch.full_analysis()
+    assert HTTP_REQUESTS.value(endpoint='/changeset/{id}', status='200') == metadata + 1
+    assert HTTP_REQUEST_SECONDS.count(
+        endpoint='/changeset/{id}/download'
+        ) == download + 1
+    assert ANALYSES.value(suspect='true') + ANALYSES.value(suspect='false') == (
+        analyses + 1
+        )
+    assert CACHE_REQUESTS.value(cache='users', result='miss') == users + 1
+    for reason in ch.suspicion_reasons:
+        assert SUSPICION_REASONS.value(reason=reason) >= 1
+
+    text = REGISTRY.render()
+    assert '# TYPE osmcha_analysis_duration_seconds histogram' in text
+    assert 'osmcha_http_requests_total{endpoint="/user/{id}",status="200"}' in text
+
+
+def test_parsed_changesets():
+    parsed = CHANGESETS_PARSED.value()
+    c = ChangesetList('tests/245.osm.gz')
+    assert CHANGESETS_PARSED.value() == parsed + len(c.xml)
+    streamed = list(ChangesetList('tests/245.osm.gz', stream=True).iter_changesets())
+    assert CHANGESETS_PARSED.value() == parsed + len(c.xml) + len(streamed)
+
+
+def test_http_server():
+    registry = MetricsRegistry()
+    registry.counter('things_total', 'Things.').inc()
+    server = start_http_server(0, '127.0.0.1', registry=registry)
+    try:
+        with urlopen('http://127.0.0.1:{}/metrics'.format(server.server_port)) as r:
+            assert r.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert r.read().decode('utf-8') == registry.render()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -1,15 +1,23 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+import gzip
+import xml.etree.ElementTree as ET
 from datetime import datetime
+import numpy as np
 from pytest import raises
 from shapely.geometry import Polygon
 
 from osmcha.changeset import ChangesetList
+from osmcha.changeset import iterparse_changesets
+from osmcha.changeset import changeset_info
+from osmcha.changeset import ChangesetRecord
+from osmcha.changeset import get_bounds_array
 from osmcha.changeset import Analyse
 from osmcha.changeset import WORDS
 from osmcha.changeset import find_words
 from osmcha.changeset import InvalidChangesetError
-from osmcha.warnings import Warnings
+from osmcha.regions import RegionIndex
+from osmcha.warnings import DEFAULT_WARNINGS, WARNINGS, WarningIndex, Warnings
 
 
 def test_find_words():
@@ -50,6 +58,88 @@ def test_changeset_list():
         ])
 
 
+def test_changeset_record():
+    """Test that ChangesetRecord works like the changeset_info dict."""
+    c = ChangesetList('tests/245.osm.gz')
+    ch = c.changesets[0]
+    assert isinstance(ch, ChangesetRecord)
+    assert ch._bbox is None
+    assert dict(ch) == {
+        'version': '2.3',
+        'created_by': 'Potlatch 2',
+        'comment': 'Added Emerald Pool Waterfall',
+        'build': '2.3-650-gad99430',
+        'id': '31982803',
+        'user': 'GarrettB',
+        'uid': '352373',
+        'bbox': Polygon([
+            (-71.0646843, 44.2371354), (-71.0048652, 44.2371354),
+            (-71.0048652, 44.2430624), (-71.0646843, 44.2430624),
+            (-71.0646843, 44.2371354)
+            ]),
+        'created_at': '2015-06-15T12:32:11Z',
+        'comments_count': '0',
+        'changes_count': '4',
+        }
+    assert ch.bbox is ch['bbox']
+    assert ch.date == datetime(2015, 6, 15, 12, 32, 11)
+    assert ch.get('source') is None
+    assert 'comment' in ch and 'source' not in ch
+    assert len(ch) == 11
+
+    ch['source'] = 'survey'
+    ch['comment'] = 'Waterfall'
+    assert ch['source'] == 'survey'
+    assert ch['comment'] == 'Waterfall'
+    del ch['source']
+    assert 'source' not in ch
+
+    # copy works like dict.copy
+    copy = ch.copy()
+    assert isinstance(copy, ChangesetRecord)
+    assert dict(copy) == dict(ch)
+    copy['comment'] = 'Copy'
+    copy['regions'] = ['a']
+    copy['changes_count'] = None
+    assert ch['comment'] == 'Waterfall'
+    assert 'regions' not in ch
+    assert ch['changes_count'] == '4'
+
+    # the mandatory keys can be deleted too
+    copy = ch.copy()
+    del copy['bbox']
+    assert 'bbox' not in copy and 'bbox' in ch
+    assert copy.pop('user') == 'GarrettB'
+    with raises(KeyError):
+        copy['user']
+    with raises(KeyError):
+        del copy['user']
+    assert copy.get('user') is None
+    assert len(copy) == len(ch) - 2 == len(dict(copy))
+    copy2 = copy.copy()
+    assert 'user' not in copy2
+    bbox = Polygon([(0, 0), (1, 0), (1, 1), (0, 0)])
+    copy['bbox'] = bbox
+    assert copy['bbox'] is bbox
+    copy.clear()
+    assert len(copy) == 0
+    assert dict(copy) == {}
+
+    # the keys of the tags are shared between the records
+    assert list(c.changesets[0])[1] is list(c.changesets[11])[0]
+
+    analyse = Analyse(c.changesets[0])
+    assert analyse.id == 31982803
+    # the date parsed by the record is reused
+    assert analyse.date is c.changesets[0].date
+    assert analyse.date == datetime(2015, 6, 15, 12, 32, 11)
+    assert analyse.metadata == {'build': '2.3-650-gad99430', 'version': '2.3'}
+
+    ch = changeset_info(ET.fromstring('<changeset id="1" uid="2" open="false"/>'))
+    assert ch['bbox'] == Polygon()
+    assert ch['user'] is None
+
+
 def test_changeset_list_with_filters():
     """Test ChangesetList class filter method."""
     c = ChangesetList('tests/245.osm.gz', 'tests/map.geojson')
@@ -57,6 +147,135 @@ def test_changeset_list_with_filters():
     assert c.changesets[0]['id'] == '31982803'
 
 
+def test_changeset_list_from_url(file_server):
+    """Test ChangesetList reading a remote replication file."""
+    url = '{}/245.osm.gz'.format(file_server)
+    c = ChangesetList(url, 'tests/map.geojson')
+    assert [ch['id'] for ch in c.changesets] == ['31982803']
+    c = ChangesetList(url, stream=True)
+    assert len(list(c.iter_changesets())) == 25
+
+
+def test_changeset_list_with_regions():
+    """Test ChangesetList with a geojson containing many features."""
+    expected = [
+        ('31982803', ['White Mountains', 'New England']),
+        ('31984168', ['Central Brazil']),
+        ('31984172', ['Central Brazil']),
+        ('31984184', ['Central Brazil']),
+        ]
+    c = ChangesetList('tests/245.osm.gz', 'tests/regions.geojson')
+    assert [(ch['id'], ch['regions']) for ch in c.changesets] == expected
+    c = ChangesetList('tests/245.osm.gz', 'tests/regions.geojson', stream=True)
+    assert [(ch['id'], ch['regions']) for ch in c.iter_changesets()] == expected
+
+    ch = Analyse(next(c.iter_changesets()))
+    assert ch.regions == ['White Mountains', 'New England']
+    assert 'regions' not in ch.metadata
+    assert 'regions' not in ch.get_dict()
+
+
+def test_changeset_list_intersects_once(monkeypatch):
+    """The exact intersection is verified once per envelope candidate, in the
+    eager and in the stream modes.
+    """
+    calls = []
+    query = RegionIndex.query
+    monkeypatch.setattr(
+        RegionIndex, 'query',
+        lambda self, geometry: calls.append('query') or query(self, geometry)
+        )
+    monkeypatch.setattr(
+        RegionIndex, 'intersects', lambda self, geometry: calls.append('intersects')
+        )
+    c = ChangesetList('tests/245.osm.gz', 'tests/regions.geojson')
+    assert len(c.changesets) == len(c.content) == 4
+    assert calls == ['query'] * 4
+
+    del calls[:]
+    c = ChangesetList('tests/245.osm.gz', 'tests/regions.geojson', stream=True)
+    assert len(list(c.iter_changesets())) == 4
+    assert calls == ['query'] * 4
+
+
+def test_region_index():
+    regions = RegionIndex.from_geojson('tests/regions.geojson')
+    assert len(regions) == 4
+    assert regions.names == ['White Mountains', 'New England', 'Central Brazil', '3']
+    assert regions.query(Polygon([(-48, -16), (-47.5, -16), (-47.5, -15.5), (-48, -16)])) == [
+        'Central Brazil'
+        ]
+    assert regions.query(Polygon([(-48.7, -17), (-48.6, -17), (-48.6, -16.9), (-48.7, -17)])) == []
+    assert regions.intersects(Polygon([(0.5, 0.5), (2, 0.5), (2, 2), (0.5, 0.5)]))
+    assert not regions.intersects(Polygon())
+
+
+def test_region_index_envelope_mask():
+    regions = RegionIndex.from_geojson('tests/regions.geojson')
+    c = ChangesetList('tests/245.osm.gz')
+    bounds = get_bounds_array(c.xml)
+    assert bounds.shape == (25, 4)
+    assert list(bounds[0]) == [-71.0646843, 44.2371354, -71.0048652, 44.2430624]
+    mask = regions.envelope_mask(bounds)
+    assert [ch.get('id') for ch, candidate in zip(c.xml, mask) if candidate] == [
+        '31982803', '31984168', '31984172', '31984184'
+        ]
+    assert list(regions.envelope_mask(np.array([[np.nan] * 4, [0.5, 0.5, 0.6, 0.6]]))) == [
+        False, True
+        ]
+    assert get_bounds_array([]).shape == (0, 4)
+
+
+def test_changeset_list_stream():
+    """Test ChangesetList iter_changesets method in the stream mode."""
+    c = ChangesetList('tests/245.osm.gz', stream=True)
+    assert not hasattr(c, 'changesets')
+    changesets = list(c.iter_changesets())
+    assert len(changesets) == 25
+    assert changesets == ChangesetList('tests/245.osm.gz').changesets
+
+    c = ChangesetList('tests/245.osm.gz', 'tests/map.geojson', stream=True)
+    changesets = list(c.iter_changesets())
+    assert len(changesets) == 1
+    assert changesets[0]['id'] == '31982803'
+    assert changesets[0]['comment'] == 'Added Emerald Pool Waterfall'
+
+
+def test_changeset_list_iter_changesets_filters():
+    """Test the filters of the ChangesetList.iter_changesets method in the
+    stream and eager modes.
+    """
+    for c in [ChangesetList('tests/245.osm.gz', stream=True), ChangesetList('tests/245.osm.gz')]:
+        assert [ch['id'] for ch in c.iter_changesets(is_open=True)] == [
+            '31984175', '31984185', '31984188'
+            ]
+        assert len(list(c.iter_changesets(is_open=False))) == 22
+        assert [ch['id'] for ch in c.iter_changesets(uids=[26299], tags=['source'])] == [
+            '31984170', '31984177', '31984186'
+            ]
+        assert [ch['id'] for ch in c.iter_changesets(tags=['source', 'comment'])] == [
+            '31984170', '31984177', '31984179', '31984183', '31984186'
+            ]
+        assert [
+            ch['id'] for ch in c.iter_changesets(
+                created_after=datetime(2015, 6, 15, 13, 34, 49),
+                created_before='2015-06-15T13:34:58Z'
+                )
+            ] == ['31984184', '31984185', '31984186']
+        assert [ch['id'] for ch in c.iter_changesets(bbox=(-72, 44, -70, 45))] == ['31982803']
+        assert len(list(c.iter_changesets())) == 25
+
+
+def test_iterparse_changesets_clears_elements():
+    with gzip.open('tests/245.osm.gz') as f:
+        elements = []
+        for changeset in iterparse_changesets(f):
+            assert changeset.get('id') is not None
+            elements.append(changeset)
+    assert len(elements) == 25
+    assert all(len(ch) == 0 and ch.get('id') is None for ch in elements)
+
+
 def test_invalid_changeset_error():
     with raises(InvalidChangesetError):
         Analyse([999])
@@ -628,9 +847,10 @@ def test_get_dict():
     assert 'create' in ch.get_dict().keys()
     assert 'modify' in ch.get_dict().keys()
     assert 'delete' in ch.get_dict().keys()
+    assert 'element_counts' in ch.get_dict().keys()
     assert 'metadata' in ch.get_dict().keys()
     assert ch.get_dict()['metadata']['host'] == 'https://www.openstreetmap.org/id'
-    assert len(ch.get_dict().keys()) == 17
+    assert len(ch.get_dict().keys()) == 18
 
     # An iD changeset with warnings:
     ch = Analyse(72783703)
@@ -651,13 +871,14 @@ def test_get_dict():
     assert 'create' in ch.get_dict().keys()
     assert 'modify' in ch.get_dict().keys()
     assert 'delete' in ch.get_dict().keys()
+    assert 'element_counts' in ch.get_dict().keys()
     assert 'metadata' in ch.get_dict().keys()
     assert ch.get_dict()['metadata']['host'] == 'https://www.openstreetmap.org/edit'
     assert ch.get_dict()['metadata']['locale'] == 'en-US'
     assert ch.get_dict()['metadata']['warnings:crossing_ways'] == 1
     assert ch.get_dict()['metadata']['changesets_count'] == 5970
     assert ch.get_dict()['comments_count'] == 2
-    assert len(ch.get_dict().keys()) == 17
+    assert len(ch.get_dict().keys()) == 18
 
     # A JOSM changeset
     ch = Analyse(46315321)
@@ -678,9 +899,10 @@ def test_get_dict():
     assert 'create' in ch.get_dict().keys()
     assert 'modify' in ch.get_dict().keys()
     assert 'delete' in ch.get_dict().keys()
+    assert 'element_counts' in ch.get_dict().keys()
     assert 'metadata' in ch.get_dict().keys()
     assert ch.get_dict()['metadata'] == {}
-    assert len(ch.get_dict().keys()) == 17
+    assert len(ch.get_dict().keys()) == 18
 
 
 def test_changeset_without_tags():
@@ -953,3 +1175,83 @@ def test_enabled_warnings():
     assert warnings.is_enabled('warnings:') is None
     assert warnings.is_enabled('warnings') is None
     assert warnings.is_enabled('warnings:suspicious_name:generic_name') == 'Generic name'
+
+
+def test_warning_index():
+    tags = [
+        'warnings:crossing_ways:building-building',
+        'warnings:crossing_ways:highway-building',
+        'warnings:impossible_oneway:highway',
+        'warnings:suspicious_name:not-name',
+        'warnings:suspicious_name:',
+        'warnings:',
+        'warnings',
+        'warnings:suspicious_name:generic_name',
+        'warnings:missing_tag',
+        'warnings:fix_me',
+        ]
+    warnings = Warnings()
+    assert WARNINGS.resolve(tags) == [
+        reason for reason in map(warnings.is_enabled, tags) if reason is not None
+        ]
+    assert WARNINGS.resolve(tags) == [
+        'Crossing ways', 'Crossing ways', 'Impossible oneway', 'Generic name',
+        'Missing tag'
+        ]
+    assert WARNINGS.lookup('warnings:fix_me') is None
+    assert WARNINGS.lookup('warnings:private_data:email') == 'Private information'
+
+    # the first warning of the list wins, as in Warnings.is_enabled
+    index = WarningIndex([
+        {'tag': 'warnings:a:b', 'reason': 'B', 'exact_match': False},
+        {'tag': 'warnings:a', 'reason': 'A', 'exact_match': False},
+        {'tag': 'warnings:a:b:c', 'reason': 'C', 'exact_match': False},
+        {'tag': 'warnings:a:b:c:d', 'reason': 'D', 'exact_match': True},
+        ])
+    assert index.lookup('warnings:a:b:c:d') == 'D'
+    assert index.lookup('warnings:a:b:c') == 'B'
+    assert index.lookup('warnings:a:x') == 'A'
+    assert index.lookup('warnings:') is None
+
+
+def test_warning_index_from_yaml(tmp_path):
+    path = tmp_path / 'warnings.yaml'
+    path.write_text(
+        "- tag: 'warnings:fix_me'\n"
+        "  reason: 'Fix me'\n"
+        "- tag: 'warnings:invalid_format'\n"
+        "  reason: 'Invalid format'\n"
+        "  exact_match: true\n"
+        )
+    index = WarningIndex.from_yaml(str(path))
+    assert len(index.warnings) == len(DEFAULT_WARNINGS) + 2
+    assert index.resolve([
+        'warnings:fix_me', 'warnings:invalid_format', 'warnings:invalid_format:x',
+        'warnings:crossing_ways'
+        ]) == ['Fix me', 'Invalid format', 'Crossing ways']
+    index = WarningIndex.from_yaml(str(path), include_defaults=False)
+    assert index.resolve(['warnings:fix_me', 'warnings:crossing_ways']) == ['Fix me']
+
+    ch_dict = {
+        'created_by': 'iD',
+        'created_at': '2019-04-25T18:08:46Z',
+        'comment': 'add pois',
+        'comments_count': '0',
+        'id': '1',
+        'user': 'JustTest',
+        'uid': '123123',
+        'warnings:fix_me': '1',
+        'warnings:crossing_ways': '1',
+        'bbox': Polygon([
+            (-71.0646843, 44.2371354), (-71.0048652, 44.2371354),
+            (-71.0048652, 44.2430624), (-71.0646843, 44.2430624),
+            (-71.0646843, 44.2371354)
+            ])
+        }
+    changeset = Analyse(ch_dict, warning_index=index)
+    changeset.verify_warning_tags()
+    assert changeset.suspicion_reasons == ['Fix me']
+    assert 'warning_index' not in changeset.get_dict()
+    changeset = Analyse(ch_dict)
+    changeset.verify_warning_tags()
+    assert changeset.suspicion_reasons == ['Crossing ways']
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from os import makedirs
+from os.path import dirname, join
+from shutil import copy
+
+from osmcha.replication import ReplicationFollower, sequence_path
+
+
+def make_replication_folder(path, sequences):
+    """Create a replication folder whose files are copies of tests/245.osm.gz."""
+    for sequence in sequences:
+        filename = join(path, sequence_path(sequence))
+        makedirs(dirname(filename), exist_ok=True)
+        copy('tests/245.osm.gz', filename)
+    with open(join(path, 'state.yaml'), 'w') as f:
+        f.write('---\nsequence: {}\n'.format(max(sequences)))
+
+
+def test_sequence_path():
+    assert sequence_path(2236374) == '002/236/374.osm.gz'
+    assert sequence_path(245) == '000/000/245.osm.gz'
+
+
+def test_read_state():
+    follower = ReplicationFollower('checkpoint.yaml', replication_url='tests')
+    assert follower.read_state() == 1392226
+
+
+def test_read_state_from_url(file_server):
+    follower = ReplicationFollower('checkpoint.yaml', replication_url=file_server)
+    assert follower.read_state() == 1392226
+
+
+def test_follower_catches_up_in_order(tmp_path):
+    replication = str(tmp_path / 'replication')
+    checkpoint = str(tmp_path / 'checkpoint.yaml')
+    make_replication_folder(replication, range(1, 8))
+
+    follower = ReplicationFollower(
+        checkpoint, replication_url=replication, start_sequence=2, workers=3
+        )
+    assert follower.read_checkpoint() is None
+    results = list(follower.follow())
+    assert [sequence for sequence, changesets in results] == [2, 3, 4, 5, 6, 7]
+    assert all(len(changesets) == 25 for sequence, changesets in results)
+    assert follower.read_checkpoint() == 7
+    assert list(follower.follow()) == []
+
+    make_replication_folder(replication, range(8, 10))
+    follower = ReplicationFollower(
+        checkpoint, replication_url=replication, geojson='tests/map.geojson'
+        )
+    results = list(follower.follow())
+    assert [sequence for sequence, changesets in results] == [8, 9]
+    assert [ch['id'] for ch in results[0][1]] == ['31982803']
+
+
+def test_follower_checkpoint_is_saved_after_processing(tmp_path):
+    replication = str(tmp_path / 'replication')
+    checkpoint = str(tmp_path / 'checkpoint.yaml')
+    make_replication_folder(replication, range(1, 5))
+    follower = ReplicationFollower(
+        checkpoint, replication_url=replication, start_sequence=1
+        )
+    for sequence, changesets in follower.follow():
+        if sequence == 2:
+            break
+    # the sequence 2 was not completely processed
+    assert follower.read_checkpoint() == 1
+    assert [sequence for sequence, changesets in follower.follow()] == [2, 3, 4]
+
+
+def test_follower_starts_from_current_sequence(tmp_path):
+    replication = str(tmp_path / 'replication')
+    make_replication_folder(replication, range(1, 5))
+    follower = ReplicationFollower(
+        str(tmp_path / 'checkpoint.yaml'), replication_url=replication
+        )
+    assert list(follower.pending_sequences()) == [4]
+
+
+def test_follower_polls_new_sequences(tmp_path, capsys):
+    replication = str(tmp_path / 'replication')
+    make_replication_folder(replication, range(1, 4))
+    follower = ReplicationFollower(
+        str(tmp_path / 'checkpoint.yaml'), replication_url=replication,
+        start_sequence=1, workers=2
+        )
+    processed = []
+    for sequence, changesets in follower.follow(poll_interval=0.01):
+        processed.append(sequence)
+        if sequence == 3:
+            # the state is updated before the file of the sequence 5 exists
+            make_replication_folder(replication, [4])
+            with open(join(replication, 'state.yaml'), 'w') as f:
+                f.write('---\nsequence: 5\n')
+        elif sequence == 4:
+            make_replication_folder(replication, [5])
+        elif sequence == 5:
+            follower.stop()
+    assert processed == [1, 2, 3, 4, 5]
+    assert follower.read_checkpoint() == 5
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from osmcha.batch import analyse_many
+from osmcha.changeset import Analyse
+from osmcha.client import OSMClient
+from osmcha.timing import Timings, record_bytes, record_request
+
+
+def test_timings():
+    calls = []
+    timings = Timings(hook=lambda name, run: calls.append((name, dict(run))))
+    record_request(100)
+    with timings.stage('a'):
+        record_request(100)
+        with timings.stage('b'):
+            record_request(10)
+            record_bytes(5)
+        record_bytes(50)
+    with timings.stage('a'):
+        record_request()
+    assert timings.as_dict()['a']['requests'] == 2
+    assert timings.as_dict()['a']['bytes'] == 150
+    assert timings.as_dict()['b']['requests'] == 1
+    assert timings.as_dict()['b']['bytes'] == 15
+    assert [name for name, run in calls] == ['b', 'a', 'a']
+    assert calls[1][1]['seconds'] >= calls[0][1]['seconds']
+    assert timings.total == sum(s['seconds'] for s in timings.stages.values())
+
+
+def test_analyse_timings(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    calls = []
+    ch = Analyse(2, client=client, timing_hook=lambda name, run: calls.append(name))
+    ch.full_analysis()
+    stages = ch.timings.as_dict()
+    assert set(stages) == {
+        'metadata', 'download', 'parse', 'words', 'user', 'warnings'
+        }
+    assert calls == ['metadata', 'download', 'words', 'user', 'warnings']
+    assert stages['metadata']['requests'] == 1
+    assert stages['metadata']['bytes'] > 0
+    assert stages['download']['requests'] == 1
+    with open('tests/api/changeset/2/download.xml', 'rb') as f:
+        assert stages['download']['bytes'] == len(f.read())
+    assert stages['parse']['seconds'] <= stages['download']['seconds']
+    assert stages['user']['requests'] == 1
+    assert stages['words']['requests'] == 0
+    assert ch.timings.total > 0
+
+    assert 'timings' not in ch.get_dict()
+    assert ch.get_dict(include_timings=True)['timings'] == stages
+
+    # the user is cached, so there is no request in the user stage
+    ch = Analyse(2, client=client)
+    ch.full_analysis()
+    assert ch.timings.as_dict()['user']['requests'] == 0
+
+
+def test_analyse_many_timings(osm_api):
+    client = OSMClient(api_url=osm_api.api_url)
+    calls = []
+    results = list(analyse_many(
+        [1, 2], client=client, timing_hook=lambda name, run: calls.append(name)
+        ))
+    for result in results:
+        assert result.analyse.timings.as_dict()['download']['requests'] == 1
+    assert calls.count('download') == 2
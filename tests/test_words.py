@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+import re
+from os import utime
+from time import sleep
+
+import yaml
+from shapely.geometry import Polygon
+
+from osmcha import words
+from osmcha.changeset import WORDS, Analyse, ChangesetList, make_regex
+from osmcha.words import (
+    WordList, WordMatcher, get_matcher, set_word_list, trie_regex
+    )
+
+
+CHANGESET = {
+    'id': '1', 'user': 'JustTest', 'uid': '123123',
+    'bbox': Polygon([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]),
+    'created_at': '2015-04-25T18:08:46Z', 'comments_count': '0',
+    'created_by': 'iD', 'comment': 'import data',
+    }
+
+
+def test_trie_regex():
+    assert trie_regex([]) == '(?!)'
+    assert trie_regex(['import']) == 'import'
+    pattern = re.compile(trie_regex(['import', 'imp', 'impact', 'goo.gl']))
+    assert pattern.match('importing').group() == 'import'
+    assert pattern.match('impa').group() == 'imp'
+    assert pattern.match('impact').group() == 'impact'
+    assert pattern.match('goo.gl').group() == 'goo.gl'
+    assert pattern.match('goo-gl') is None
+
+
+def test_word_matcher_comment():
+    matcher = WordMatcher(
+        WORDS['sources'] + WORDS['common'], WORDS['exclude'], WORDS['sources']
+        )
+    assert matcher.find_words('Import buildings') == ['import']
+    assert matcher.find_words('imported Importação unimportant') == ['import', 'import']
+    assert matcher.find_words('important edit') == []
+    assert matcher.find_words('reimport from GooGle') == ['reimport', 'google']
+    assert matcher.find_words('somewhere in the world') == []
+    assert matcher.find_words('Импортировать здания') == ['импортировать']
+    assert matcher.find_words('Yandex Panorama') == []
+
+
+def test_word_matcher_sources():
+    matcher = WordMatcher([], illegal_sources=['yandex', 'яндекс', 'goo', 'google'])
+    assert matcher.find_sources('Bing; Google Maps') == ['goo', 'google']
+    assert matcher.find_sources('survey') == []
+    assert matcher.find_sources('yandex panorama') == []
+    assert matcher.find_sources('yandex panorama', exceptions=False) == ['yandex']
+    assert matcher.find_sources('Яндекс.Панорамы; yandex') == ['yandex']
+    assert matcher.find_sources('Яндекс Панорамы; yandex maps') == ['yandex']
+
+
+def test_word_matcher_scan():
+    matcher = get_matcher(
+        WORDS['sources'] + WORDS['common'], WORDS['exclude'], WORDS['sources']
+        )
+    assert matcher.scan('add pois', 'survey', 'Bing') == {}
+    assert matcher.scan(None, None, None) == {}
+    assert matcher.scan('vandalism', 'Yandex Panorama', 'yandex panorama') == {
+        'comment': ['vandal'], 'imagery_used': ['yandex']
+        }
+    assert matcher.scan('add pois', 'waze;survey') == {'source': ['waze']}
+    # the matchers are compiled once for each combination of lists
+    assert matcher is get_matcher(
+        tuple(WORDS['sources'] + WORDS['common']), WORDS['exclude'], WORDS['sources']
+        )
+    assert matcher is not get_matcher(WORDS['common'], WORDS['exclude'], WORDS['sources'])
+
+
+def test_word_matcher_corpus():
+    """The matcher finds the same words as the make_regex expressions in the
+    comments of a replication file.
+    """
+    suspect_words = WORDS['sources'] + WORDS['common']
+    matcher = WordMatcher(suspect_words, WORDS['exclude'])
+    comments = [
+        ch.get('comment', '').lower()
+        for ch in ChangesetList('tests/245.osm.gz').changesets
+        ]
+    comments += ['import from google', 'testing the new imports', 'haha mess']
+    suspect_regex = re.compile(make_regex(suspect_words))
+    for comment in comments:
+        assert len(matcher._suspect.findall(comment)) == len(
+            suspect_regex.findall(comment)
+            )
+
+
+def write_words(path, common):
+    with open(path, 'w') as f:
+        f.write(yaml.safe_dump(
+            {'common': common, 'sources': ['waze'], 'exclude': ['important']}
+            ))
+
+
+def test_word_list_reload(tmp_path):
+    path = str(tmp_path / 'words.yaml')
+    write_words(path, ['import'])
+    word_list = WordList(path)
+    first = word_list.snapshot()
+    assert first.suspect_words == ['import', 'waze']
+    assert first.matcher.scan('import data') == {'comment': ['import']}
+    assert word_list.reload() is False
+
+    write_words(path, ['vandal'])
+    utime(path, (first.mtime + 10, first.mtime + 10))
+    assert word_list.reload() is True
+    second = word_list.snapshot()
+    assert second.suspect_words == ['vandal', 'waze']
+    assert second.matcher.scan('import data') == {}
+    # the previous version is not modified
+    assert first.matcher.scan('import data') == {'comment': ['import']}
+
+    # an invalid file doesn't replace the lists
+    with open(path, 'w') as f:
+        f.write('common: [')
+    utime(path, (first.mtime + 20, first.mtime + 20))
+    assert word_list.reload() is False
+    assert word_list.snapshot() is second
+
+
+def test_word_list_watch(tmp_path):
+    path = str(tmp_path / 'words.yaml')
+    write_words(path, ['import'])
+    word_list = WordList(path)
+    previous = words._default_word_list
+    set_word_list(word_list)
+    try:
+        ch = Analyse(CHANGESET)
+        word_list.watch(interval=0.01)
+        write_words(path, ['vandal'])
+        mtime = word_list.snapshot().mtime + 10
+        utime(path, (mtime, mtime))
+        for _ in range(500):
+            if word_list.snapshot().mtime == mtime:
+                break
+            sleep(0.01)
+        assert word_list.snapshot().suspect_words == ['vandal', 'waze']
+        # the analysis created before the reload keeps its lists
+        ch.verify_words()
+        assert ch.suspicion_reasons == ['suspect_word']
+        ch = Analyse(CHANGESET)
+        ch.verify_words()
+        assert ch.suspicion_reasons == []
+        assert Analyse(CHANGESET, suspect_words=['import']).suspect_words == ['import']
+    finally:
+        word_list.stop()
+        set_word_list(previous)
+
+
+def test_analyse_uses_snapshot_matcher(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        'osmcha.changeset.get_matcher', lambda *lists: calls.append(lists) or get_matcher(*lists)
+        )
+    ch = Analyse(CHANGESET)
+    ch.verify_words()
+    # the default lists don't need a lookup of the matcher
+    assert calls == []
+    assert ch.suspicion_reasons == ['suspect_word']
+    assert 'word_snapshot' not in ch.get_dict()
+
+    ch = Analyse(CHANGESET, suspect_words=['vandal'])
+    ch.verify_words()
+    assert len(calls) == 1
+    assert ch.suspicion_reasons == []